@@ -1,10 +1,66 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.views.main import ORDER_VAR, SEARCH_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.http import Http404, HttpResponseBadRequest
+from django.urls import path, reverse
+from . import bulk, export, read_model, uploads
+from .filters import (
+    AUTOCOMPLETE_FILTER_CSS, AUTOCOMPLETE_FILTER_JS,
+    AmenityAutocompleteFilter, LocationAutocompleteFilter,
+    PropertyAutocompleteFilter)
 from .models import Location, Amenity, Property, PropertyImage
+from .pagination import LargeTableAdminMixin
+from .renditions import rendition_url
+from .search import RANK_ORDERING, search_properties, search_terms
+from .summary_cache import attach_summaries
 from django.utils.html import format_html
 
 
+class PrefixSearchMixin:
+    """Search ``name`` by case-insensitive prefix in the autocomplete
+    widgets and filters, which search on every keystroke.
+
+    The range on lower(name) is served by the functional index on that
+    expression, unlike the default ILIKE '%term%' which scans the table.
+    The changelist keeps the substring search of ``search_fields``.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        match = request.resolver_match
+        if match is None or match.url_name != 'autocomplete':
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        term = search_term.strip().lower()
+        if not term:
+            return queryset, False
+        return queryset.alias(lower_name=Lower('name')).filter(
+            lower_name__gte=term,
+            lower_name__lt=term + '\uffff',
+            lower_name__startswith=term,
+        ).order_by('lower_name', 'pk'), False
+
+
+class PropertyImageInlineFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        featured = [
+            form for form in self.forms
+            if form.cleaned_data.get('is_featured')
+            and not form.cleaned_data.get('DELETE')
+        ]
+        if len(featured) > 1:
+            raise ValidationError('Only one image can be featured.')
+
+
 class PropertyImageInline(admin.TabularInline):
     model = PropertyImage
+    formset = PropertyImageInlineFormSet
     extra = 1
     fields = ('image', 'image_preview', 'caption', 'is_featured')
     readonly_fields = ('image_preview',)
@@ -14,7 +70,7 @@ class PropertyImageInline(admin.TabularInline):
             return format_html(
                 '<img src="{}" style="max-width: 150px; max-height: 150px;" '
                 'class="image-preview" id="image-preview-{}"/>',
-                obj.image.url,
+                obj.rendition_url(),
                 obj.id or '__prefix__'
             )
         return format_html(
@@ -26,7 +82,8 @@ class PropertyImageInline(admin.TabularInline):
 
 
 @admin.register(Location)
-class LocationAdmin(admin.ModelAdmin):
+class LocationAdmin(LargeTableAdminMixin, PrefixSearchMixin,
+                    admin.ModelAdmin):
     list_display = ('name', 'type', 'latitude', 'longitude',
                     'create_date', 'update_date')
     list_display_links = ('name',)
@@ -45,7 +102,7 @@ class LocationAdmin(admin.ModelAdmin):
 
 
 @admin.register(Amenity)
-class AmenityAdmin(admin.ModelAdmin):
+class AmenityAdmin(PrefixSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'create_date', 'update_date')
     readonly_fields = ('create_date', 'update_date')
     search_fields = ('name',)
@@ -62,22 +119,42 @@ class AmenityAdmin(admin.ModelAdmin):
     )
 
 
+class PropertyActionForm(ActionForm):
+    """Action bar with the amenity and location the relation actions
+    add or remove."""
+    amenity = forms.ModelChoiceField(
+        Amenity.objects.all(), required=False,
+        widget=AutocompleteSelect(
+            Property._meta.get_field('amenities'), admin.site))
+    location = forms.ModelChoiceField(
+        Location.objects.all(), required=False,
+        widget=AutocompleteSelect(
+            Property._meta.get_field('locations'), admin.site))
+
+
 @admin.register(Property)
-class PropertyAdmin(admin.ModelAdmin):
+class PropertyAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     class Media:
+        js = AUTOCOMPLETE_FILTER_JS + ('js/admin/image_preview.js',)
         css = {
-            'all': ('css/custom_admin.css',)
+            'all': ('css/custom_admin.css',),
+            'screen': AUTOCOMPLETE_FILTER_CSS,
         }
     list_display = ('display_featured_image', 'property_id', 'title',
                     'display_locations', 'display_amenities',
                     'create_date', 'update_date')
     list_display_links = ('title',)
     ordering = ('property_id',)
-    list_filter = ('locations', 'amenities', 'create_date', 'update_date')
+    keyset_field = 'property_id'
+    list_filter = (LocationAutocompleteFilter, AmenityAutocompleteFilter,
+                   'create_date', 'update_date')
     search_fields = ('property_id', 'title', 'description')
-    filter_horizontal = ('locations', 'amenities')
+    autocomplete_fields = ('locations', 'amenities')
     readonly_fields = ('create_date', 'update_date')
     inlines = [PropertyImageInline]
+    action_form = PropertyActionForm
+    actions = ['add_relations', 'remove_relations', 'feature_first_image',
+               'export_csv', 'export_jsonl']
 
     fieldsets = (
         ('Property Details', {
@@ -92,22 +169,205 @@ class PropertyAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view),
+                 name='admin_panel_property_export'),
+            path('<path:object_id>/uploads/',
+                 self.upload_view(uploads.start_view),
+                 name='admin_panel_property_upload_start'),
+            path('<path:object_id>/uploads/complete/',
+                 self.upload_view(uploads.complete_view),
+                 name='admin_panel_property_upload_complete'),
+            path('<path:object_id>/uploads/<str:upload_id>/',
+                 self.upload_view(uploads.chunk_view),
+                 name='admin_panel_property_upload'),
+        ] + super().get_urls()
+
+    def upload_view(self, view):
+        """``view`` called with the property being changed, for users
+        allowed to change it."""
+        def wrapper(request, object_id, **kwargs):
+            obj = self.get_object(request, unquote(object_id))
+            if obj is None:
+                raise Http404
+            if not self.has_change_permission(request, obj):
+                raise PermissionDenied
+            return view(request, obj, **kwargs)
+        return self.admin_site.admin_view(wrapper)
+
+    def change_view(self, request, object_id, form_url='',
+                    extra_context=None):
+        extra_context = {
+            'upload_url': reverse('admin:admin_panel_property_upload_start',
+                                  args=[object_id]),
+            'upload_chunk_size': uploads.chunk_size(),
+            **(extra_context or {}),
+        }
+        return super().change_view(request, object_id, form_url,
+                                   extra_context)
+
+    def export_view(self, request):
+        """Every property as CSV (``?format=csv``) or JSON Lines
+        (``?format=jsonl``), optionally only those linked to the
+        ``location`` or ``amenity`` id."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in export.CONTENT_TYPES:
+            return HttpResponseBadRequest(
+                f"Unknown format '{export_format}'")
+        queryset = Property.objects.order_by('pk')
+        try:
+            if request.GET.get('location'):
+                queryset = queryset.filter(
+                    locations__id=int(request.GET['location']))
+            if request.GET.get('amenity'):
+                queryset = queryset.filter(
+                    amenities__id=int(request.GET['amenity']))
+        except ValueError:
+            return HttpResponseBadRequest(
+                "'location' and 'amenity' must be integers")
+        return export.streaming_response(request, export_format, queryset)
+
+    def chosen_relations(self, request):
+        """(field name, ids) of the amenity and location picked in the
+        action bar."""
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            return []
+        return [
+            (field_name, [form.cleaned_data[key].pk])
+            for key, field_name in (('amenity', 'amenities'),
+                                    ('location', 'locations'))
+            if form.cleaned_data[key]
+        ]
+
+    @admin.action(description='Add the chosen amenity and location to '
+                              'selected properties',
+                  permissions=['change'])
+    def add_relations(self, request, queryset):
+        relations = self.chosen_relations(request)
+        if not relations:
+            self.message_user(request, 'Choose an amenity or a location.',
+                              messages.WARNING)
+            return
+        property_ids = list(queryset.values_list('pk', flat=True))
+        added = sum(bulk.add_related(field_name, property_ids, related_ids)
+                    for field_name, related_ids in relations)
+        self.message_user(request, f'Added {added} links to '
+                                   f'{len(property_ids)} properties.')
+
+    @admin.action(description='Remove the chosen amenity and location from '
+                              'selected properties',
+                  permissions=['change'])
+    def remove_relations(self, request, queryset):
+        relations = self.chosen_relations(request)
+        if not relations:
+            self.message_user(request, 'Choose an amenity or a location.',
+                              messages.WARNING)
+            return
+        property_ids = list(queryset.values_list('pk', flat=True))
+        removed = sum(
+            bulk.remove_related(field_name, property_ids, related_ids)
+            for field_name, related_ids in relations)
+        self.message_user(request, f'Removed {removed} links from '
+                                   f'{len(property_ids)} properties.')
+
+    @admin.action(description='Feature the first image of selected '
+                              'properties without a featured image',
+                  permissions=['change'])
+    def feature_first_image(self, request, queryset):
+        property_ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic():
+            featured = bulk.feature_first_images(property_ids)
+            read_model.refresh(property_ids)
+        self.message_user(request, f'Featured {featured} images.')
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not PropertyImage:
+            return super().save_formset(request, form, formset, change)
+        images = formset.save(commit=False)
+        for image in formset.deleted_objects:
+            image.delete()
+        bulk.delete_files_on_commit(
+            image.image.name for image in formset.deleted_objects)
+        featured = [image for image in images if image.is_featured]
+        if featured:
+            # The featured image moves here, also from an image that is
+            # not in the form, such as one uploaded since it was opened
+            PropertyImage.objects.filter(
+                property=form.instance, is_featured=True).exclude(
+                pk=featured[0].pk).update(is_featured=False)
+        for image in images:
+            image.save()
+        formset.save_m2m()
+
+    def delete_model(self, request, obj):
+        names = list(obj.images.values_list('image', flat=True))
+        super().delete_model(request, obj)
+        bulk.delete_files_on_commit(names)
+
+    def delete_queryset(self, request, queryset):
+        names = list(PropertyImage.objects.filter(
+            property__in=queryset).values_list('image', flat=True))
+        super().delete_queryset(request, queryset)
+        bulk.delete_files_on_commit(names)
+
+    @admin.action(description='Export selected properties as CSV',
+                  permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export.streaming_response(request, 'csv', queryset)
+
+    @admin.action(description='Export selected properties as JSON Lines',
+                  permissions=['view'])
+    def export_jsonl(self, request, queryset):
+        return export.streaming_response(request, 'jsonl', queryset)
+
+    def get_changelist_instance(self, request):
+        # Locations, amenities and featured image of the whole page come
+        # from the summary cache in one read
+        cl = super().get_changelist_instance(request)
+        cl.result_list = attach_summaries(cl.result_list)
+        return cl
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        # Ranked full-text search on the search index instead of
+        # ILIKE '%term%' over title and description
+        results = search_properties(queryset, search_term)
+        if ORDER_VAR in request.GET:
+            # Sorted on a column, which wins over the rank
+            results = results.order_by(*queryset.query.order_by)
+        return results, False
+
+    def get_ordering(self, request):
+        # Best matches first when searching, unless a column is sorted on
+        if (search_terms(request.GET.get(SEARCH_VAR, ''))
+                and ORDER_VAR not in request.GET):
+            return RANK_ORDERING
+        return super().get_ordering(request)
+
     def display_amenities(self, obj):
         # Display first 3 amenities
-        return ", ".join([amenity.name for amenity in obj.amenities.all()[:3]])
+        return ", ".join(obj.summary['amenities'][:3])
     display_amenities.short_description = 'Amenities'  # Sets column header
 
     def display_locations(self, obj):
-        return ", ".join([location.name for location in obj.locations.all()])
+        return ", ".join(obj.summary['locations'])
     display_locations.short_description = 'Locations'
 
     def display_featured_image(self, obj):
-        featured_image = obj.images.filter(is_featured=True).first()
-        if featured_image:
+        summary = obj.summary
+        if summary['featured_image']:
+            storage = PropertyImage._meta.get_field('image').storage
             return format_html(
                 '<img src="{}" width="100" height="80" '
                 'style="object-fit: cover;" />',
-                featured_image.image.url
+                rendition_url(storage, summary['featured_image'],
+                              summary['featured_image_has_renditions'])
             )
         return "No featured image"
 
@@ -115,20 +375,25 @@ class PropertyAdmin(admin.ModelAdmin):
 
 
 @admin.register(PropertyImage)
-class PropertyImageAdmin(admin.ModelAdmin):
+class PropertyImageAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     class Media:
-        js = ('js/admin/property_image_preview.js',)
+        js = AUTOCOMPLETE_FILTER_JS + ('js/admin/property_image_preview.js',)
         css = {
-            'all': ('css/property_image.css',)
+            'all': ('css/property_image.css',),
+            'screen': AUTOCOMPLETE_FILTER_CSS,
         }
     list_display = ('image_preview', 'property', 'caption',
                     'is_featured', 'created_at', 'updated_at')
     readonly_fields = ('created_at', 'updated_at', 'image_preview')
-    list_filter = ('property__title', 'is_featured',
+    list_filter = (PropertyAutocompleteFilter, 'is_featured',
                    'created_at', 'updated_at')
-    ordering = ('property',)
+    autocomplete_fields = ('property',)
+    # Keyset pages seek on id, so numbered pages list by id too
+    ordering = ('id',)
+    keyset_field = 'id'
     search_fields = ('property__title', 'property__property_id')
     list_display_links = ('property',)
+    actions = ['make_featured']
     fieldsets = (
         (None, {
             'fields': ('property', 'image', 'image_preview',
@@ -147,7 +412,7 @@ class PropertyImageAdmin(admin.ModelAdmin):
                 '<img src="{}" width="180" height="180" '
                 'style="object-fit: cover;" id="preview-{}" />'
                 '</a>',
-                obj.image.url, obj.image.url, obj.id or '__new__'
+                obj.image.url, obj.rendition_url(), obj.id or '__new__'
             )
 
         return format_html(
@@ -157,3 +422,17 @@ class PropertyImageAdmin(admin.ModelAdmin):
         )
 
     image_preview.short_description = 'Image Preview'
+
+    @admin.action(description='Make selected images featured',
+                  permissions=['change'])
+    def make_featured(self, request, queryset):
+        featured = bulk.feature_images(queryset)
+        self.message_user(request, f'Featured {featured} images.')
+
+    def delete_model(self, request, obj):
+        bulk.delete_images(PropertyImage.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        # One DELETE for the whole selection, then the files no other
+        # image uses
+        bulk.delete_images(queryset)
@@ -0,0 +1,254 @@
+from functools import wraps
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.http import require_GET
+from .models import (
+    Amenity, Location, Property, PropertyImage, PropertySummary)
+from .renditions import rendition_url
+from .search import search_properties
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def staff_required(view):
+    """Let only logged in staff users call ``view``, or anyone when
+    settings.API_PUBLIC is true. Others get a JSON error rather than a
+    redirect to the login page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(settings, 'API_PUBLIC', False):
+            if not request.user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required'},
+                                    status=401)
+            if not (request.user.is_active and request.user.is_staff):
+                return JsonResponse({'error': 'Permission denied'},
+                                    status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def property_queryset():
+    # Three extra queries per response, however many properties it holds
+    return Property.objects.prefetch_related(
+        Prefetch('locations', queryset=Location.objects.order_by('id')),
+        Prefetch('amenities', queryset=Amenity.objects.order_by('name')),
+        Prefetch('images', queryset=PropertyImage.objects.order_by('id')),
+    )
+
+
+def serialize_property(obj):
+    return {
+        'id': obj.id,
+        'property_id': obj.property_id,
+        'title': obj.title,
+        'description': obj.description,
+        'locations': [
+            {
+                'id': location.id,
+                'name': location.name,
+                'type': location.type,
+                'latitude': location.latitude,
+                'longitude': location.longitude,
+            }
+            for location in obj.locations.all()
+        ],
+        'amenities': [amenity.name for amenity in obj.amenities.all()],
+        'images': [
+            {
+                'id': image.id,
+                'url': image.image.url,
+                'thumbnail_url': image.rendition_url(),
+                'caption': image.caption,
+                'is_featured': image.is_featured,
+            }
+            for image in obj.images.all()
+        ],
+        'create_date': obj.create_date,
+        'update_date': obj.update_date,
+    }
+
+
+def serialize_summary(row):
+    featured_image = None
+    if row.featured_image:
+        storage = PropertyImage._meta.get_field('image').storage
+        featured_image = {
+            'url': storage.url(row.featured_image),
+            'thumbnail_url': rendition_url(
+                storage, row.featured_image,
+                row.featured_image_has_renditions),
+        }
+    return {
+        'id': row.property_id,
+        'property_id': row.external_id,
+        'title': row.title,
+        'description': row.description,
+        'locations': row.locations,
+        'amenities': row.amenities,
+        'featured_image': featured_image,
+        'image_count': row.image_count,
+        'create_date': row.create_date,
+        'update_date': row.update_date,
+    }
+
+
+def int_param(request, name, default=None):
+    value = request.GET.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+
+
+@require_GET
+@staff_required
+def property_list(request):
+    """Properties ordered by id, paginated with an ``after`` cursor.
+
+    ``WHERE id > after ORDER BY id LIMIT n`` walks the primary key index,
+    so a deep page costs the same as the first one.
+    """
+    try:
+        after = int_param(request, 'after', 0)
+        limit = int_param(request, 'limit', DEFAULT_PAGE_SIZE)
+        location = int_param(request, 'location')
+        amenity = int_param(request, 'amenity')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    queryset = property_queryset().filter(id__gt=after)
+    if location is not None:
+        queryset = queryset.filter(locations__id=location)
+    if amenity is not None:
+        queryset = queryset.filter(amenities__id=amenity)
+
+    # One extra row tells whether there is a next page
+    properties = list(queryset.order_by('id')[:limit + 1])
+    next_url = None
+    if len(properties) > limit:
+        properties = properties[:limit]
+        params = request.GET.copy()
+        params['after'] = properties[-1].id
+        next_url = (f"{reverse('api-property-list')}?"
+                    f"{urlencode(params, doseq=True)}")
+
+    return JsonResponse({
+        'results': [serialize_property(obj) for obj in properties],
+        'next': next_url,
+    })
+
+
+@require_GET
+@staff_required
+def property_summaries(request):
+    """Property summaries ordered by id, paginated like ``property_list``.
+
+    Every field comes from the PropertySummary table, so a page is a
+    single index scan with no joins unless it is filtered.
+    """
+    try:
+        after = int_param(request, 'after', 0)
+        limit = int_param(request, 'limit', DEFAULT_PAGE_SIZE)
+        location = int_param(request, 'location')
+        amenity = int_param(request, 'amenity')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    queryset = PropertySummary.objects.filter(property_id__gt=after)
+    if location is not None:
+        queryset = queryset.filter(property__locations__id=location)
+    if amenity is not None:
+        queryset = queryset.filter(property__amenities__id=amenity)
+
+    rows = list(queryset.order_by('property_id')[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1].property_id
+        next_url = (f"{reverse('api-property-summaries')}?"
+                    f"{urlencode(params, doseq=True)}")
+
+    return JsonResponse({
+        'results': [serialize_summary(row) for row in rows],
+        'next': next_url,
+    })
+
+
+@require_GET
+@staff_required
+def properties_near(request):
+    """Properties closest to ``lat``/``lon``.
+
+    With ``radius`` (km) every property within that distance is a match,
+    otherwise the ``limit`` nearest properties are returned.
+    """
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+        radius = request.GET.get('radius')
+        radius = float(radius) if radius else None
+        limit = int_param(request, 'limit', DEFAULT_PAGE_SIZE)
+    except KeyError as e:
+        return JsonResponse({'error': f"'{e.args[0]}' is required"},
+                            status=400)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid coordinates, radius or limit'},
+                            status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Coordinates out of range'},
+                            status=400)
+    if radius is not None and radius <= 0:
+        return JsonResponse({'error': "'radius' must be positive"},
+                            status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if radius is None:
+        properties = property_queryset().nearest(latitude, longitude, limit)
+    else:
+        properties = property_queryset().near(
+            latitude, longitude, radius, limit)
+
+    return JsonResponse({
+        'results': [
+            dict(serialize_property(obj), distance_km=round(obj.distance, 3))
+            for obj in properties
+        ],
+    })
+
+
+@require_GET
+@staff_required
+def property_search(request):
+    """Properties matching ``q`` in title or description, best first."""
+    text = request.GET.get('q', '')
+    try:
+        limit = int_param(request, 'limit', DEFAULT_PAGE_SIZE)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    properties = search_properties(property_queryset(), text)[:limit]
+    return JsonResponse({
+        'results': [
+            dict(serialize_property(obj), rank=obj.search_rank)
+            for obj in properties
+        ],
+    })
+
+
+@require_GET
+@staff_required
+def property_detail(request, pk):
+    obj = property_queryset().filter(pk=pk).first()
+    if obj is None:
+        return JsonResponse({'error': 'Property not found'}, status=404)
+    return JsonResponse(serialize_property(obj))
@@ -0,0 +1,136 @@
+from django.db import connection, transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from .models import Property, PropertyImage
+from .renditions import RENDITION_SIZES, rendition_name
+from . import read_model
+
+# Rows written or deleted per statement
+BATCH_SIZE = 1000
+
+
+def feature_images(queryset):
+    """Make the images of ``queryset`` featured, the newest one when
+    several belong to the same property, and unfeature the other images
+    of those properties. Returns the number of images featured."""
+    # order_by() drops the ordering, which would be grouped on as well
+    chosen = list(queryset.order_by().values('property_id').annotate(
+        newest=Max('id')).values_list('property_id', 'newest'))
+    property_ids = [property_id for property_id, _ in chosen]
+    image_ids = [image_id for _, image_id in chosen]
+    now = timezone.now()
+    with transaction.atomic():
+        # Unfeatured first, so there is never a second featured image
+        PropertyImage.objects.filter(
+            property_id__in=property_ids, is_featured=True).exclude(
+            pk__in=image_ids).update(is_featured=False, updated_at=now)
+        PropertyImage.objects.filter(pk__in=image_ids).update(
+            is_featured=True, updated_at=now)
+        read_model.refresh(property_ids)
+    return len(image_ids)
+
+
+def feature_first_images(property_ids=None):
+    """Feature the first image of each property that has images but no
+    featured one, every such property when ``property_ids`` is None.
+    Returns the number of images featured.
+
+    The caller refreshes the summaries.
+    """
+    featured = PropertyImage.objects.filter(
+        property_id=OuterRef('property_id'), is_featured=True)
+    images = PropertyImage.objects.exclude(Exists(featured))
+    if property_ids is not None:
+        images = images.filter(property_id__in=property_ids)
+    first = images.order_by().values('property_id').annotate(
+        first=Min('id')).values('first')
+    return PropertyImage.objects.filter(pk__in=first).update(
+        is_featured=True)
+
+
+def through_table(field_name):
+    """The through model of the ``locations`` or ``amenities`` relation
+    and the name of its column pointing at the related rows."""
+    field = Property._meta.get_field(field_name)
+    through = field.remote_field.through
+    column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    return through, column
+
+
+def add_related(field_name, property_ids, related_ids):
+    """Link every property to every related row of the ``locations`` or
+    ``amenities`` relation. Returns the number of links created."""
+    through, column = through_table(field_name)
+    property_ids = list(property_ids)
+    existing = set(through.objects.filter(
+        property_id__in=property_ids,
+        **{f'{column}__in': related_ids}).values_list('property_id', column))
+    links = [
+        through(property_id=property_id, **{column: related_id})
+        for property_id in property_ids for related_id in related_ids
+        if (property_id, related_id) not in existing
+    ]
+    with transaction.atomic():
+        through.objects.bulk_create(
+            links, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        read_model.refresh(link.property_id for link in links)
+    return len(links)
+
+
+def remove_related(field_name, property_ids, related_ids):
+    """Unlink the properties from the related rows of the ``locations`` or
+    ``amenities`` relation. Returns the number of links removed."""
+    through, column = through_table(field_name)
+    links = through.objects.filter(
+        property_id__in=list(property_ids), **{f'{column}__in': related_ids})
+    with transaction.atomic():
+        changed = set(links.values_list('property_id', flat=True))
+        deleted, _ = links.delete()
+        read_model.refresh(changed)
+    return deleted
+
+
+def delete_images(queryset):
+    """Delete the images of ``queryset`` and then the files, renditions
+    included, that no remaining image uses. Returns the number of images
+    deleted."""
+    images = list(queryset.values_list('pk', 'property_id', 'image'))
+    table = connection.ops.quote_name(PropertyImage._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(images), BATCH_SIZE):
+            # PropertyImage has no dependent rows, so this is a plain
+            # DELETE instead of loading every image to send post_delete
+            pks = [pk for pk, _, _ in images[start:start + BATCH_SIZE]]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN "
+                f"({', '.join(['%s'] * len(pks))})", pks)
+        read_model.refresh(property_id for _, property_id, _ in images)
+        delete_files_on_commit(name for _, _, name in images)
+    return len(images)
+
+
+def delete_files_on_commit(names):
+    """Delete the files of ``names`` no image uses once the current
+    transaction commits. Files are shared by content, so an image being
+    deleted does not mean its file is unused."""
+    names = {name for name in names if name}
+    if names:
+        transaction.on_commit(lambda: delete_unused_files(names))
+
+
+def delete_unused_files(names):
+    storage = PropertyImage._meta.get_field('image').storage
+    names = list(names)
+    used = set()
+    for start in range(0, len(names), BATCH_SIZE):
+        used.update(PropertyImage.objects.filter(
+            image__in=names[start:start + BATCH_SIZE]).values_list(
+            'image', flat=True))
+    deleted = 0
+    for name in set(names) - used:
+        for file_name in [name] + [rendition_name(name, size)
+                                   for size in RENDITION_SIZES]:
+            if storage.exists(file_name):
+                storage.delete(file_name)
+                deleted += 1
+    return deleted
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import uuid
+from pathlib import PurePosixPath
+from django.core.files import File
+
+# Blobs live under property_images/<first two hex digits>/<sha256><ext>,
+# so a file is stored once however many images point at it
+STORE_PREFIX = 'property_images'
+CHUNK_SIZE = 64 * 1024
+
+
+def content_name(digest, file_name):
+    suffix = PurePosixPath(file_name).suffix.lower()
+    return f'{STORE_PREFIX}/{digest[:2]}/{digest}{suffix}'
+
+
+def hash_file(file):
+    """sha256 of ``file``, read in chunks from the start and rewound
+    afterwards."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class HashingFile(File):
+    """``file``, hashed as the storage reads it in chunks."""
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self.digest = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size or CHUNK_SIZE):
+            self.digest.update(chunk)
+            yield chunk
+
+
+def store(storage, file, file_name):
+    """Save ``file`` under its content hash unless that blob exists.
+
+    The file is read once: it is written to a temporary name while being
+    hashed, then renamed to its blob, or deleted if the blob is already
+    stored. Returns (name, digest, created).
+    """
+    suffix = PurePosixPath(file_name).suffix.lower()
+    hashing = HashingFile(file)
+    temporary = storage.save(
+        f'{STORE_PREFIX}/tmp/{uuid.uuid4().hex}{suffix}', hashing)
+    digest = hashing.digest.hexdigest()
+    name = content_name(digest, file_name)
+    if storage.exists(name):
+        storage.delete(temporary)
+        return name, digest, False
+    rename(storage, temporary, name)
+    return name, digest, True
+
+
+def rename(storage, old_name, new_name):
+    try:
+        old_path, new_path = storage.path(old_name), storage.path(new_name)
+    except NotImplementedError:
+        # Storages without local paths copy the file instead
+        with storage.open(old_name) as file:
+            saved = storage.save(new_name, file)
+        storage.delete(old_name)
+        if saved != new_name:
+            # Another thread stored the same content first
+            storage.delete(saved)
+        return
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    # Atomic, and the same content if another thread got there first
+    os.replace(old_path, new_path)
@@ -0,0 +1,104 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from .models import Amenity, Location, Property, PropertyImage
+
+# Properties per chunk; each chunk costs one prefetch query per relation
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+CSV_COLUMNS = ['id', 'property_id', 'title', 'description', 'locations',
+               'amenities', 'featured_image', 'images', 'create_date',
+               'update_date']
+# Joins the names and URLs of a property in one CSV cell
+CSV_SEPARATOR = '|'
+
+
+def export_queryset(queryset=None):
+    if queryset is None:
+        queryset = Property.objects.order_by('pk')
+    return queryset.prefetch_related(
+        Prefetch('locations', queryset=Location.objects.only(
+            'id', 'name', 'type').order_by('id')),
+        Prefetch('amenities', queryset=Amenity.objects.only(
+            'id', 'name').order_by('name')),
+        Prefetch('images', queryset=PropertyImage.objects.only(
+            'id', 'property', 'image', 'is_featured').order_by('id')),
+    )
+
+
+def records(queryset, chunk_size=CHUNK_SIZE, build_url=str):
+    """A dict per property. ``iterator()`` reads ``chunk_size`` rows at a
+    time and prefetches their relations per chunk, so memory stays flat
+    however many properties there are."""
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        images = list(obj.images.all())
+        featured = [image for image in images if image.is_featured]
+        yield {
+            'id': obj.id,
+            'property_id': obj.property_id,
+            'title': obj.title,
+            'description': obj.description,
+            'locations': [
+                {'id': location.id, 'name': location.name,
+                 'type': location.type}
+                for location in obj.locations.all()
+            ],
+            'amenities': [amenity.name for amenity in obj.amenities.all()],
+            # The oldest featured image wins, as in the summaries
+            'featured_image': build_url(featured[0].image.url)
+            if featured else None,
+            'images': [build_url(image.image.url) for image in images],
+            'create_date': obj.create_date,
+            'update_date': obj.update_date,
+        }
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        row['locations'] = CSV_SEPARATOR.join(
+            location['name'] for location in row['locations'])
+        row['amenities'] = CSV_SEPARATOR.join(row['amenities'])
+        row['images'] = CSV_SEPARATOR.join(row['images'])
+        yield writer.writerow(
+            ['' if row[column] is None else row[column]
+             for column in CSV_COLUMNS])
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(export_format, queryset=None, chunk_size=CHUNK_SIZE,
+                 build_url=str):
+    """Lines of text making up the export of ``queryset`` (every property
+    by default), produced lazily."""
+    rows = records(export_queryset(queryset), chunk_size, build_url)
+    if export_format == 'csv':
+        return csv_lines(rows)
+    return jsonl_lines(rows)
+
+
+def streaming_response(request, export_format, queryset=None):
+    """The export as an attachment, sent while it is being produced."""
+    response = StreamingHttpResponse(
+        export_lines(export_format, queryset,
+                     build_url=request.build_absolute_uri),
+        content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="properties.{export_format}"')
+    return response
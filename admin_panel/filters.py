@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+_extra = '' if settings.DEBUG else '.min'
+
+# The same files the admin's own autocomplete widgets load, so they are
+# only included once on pages that have both
+AUTOCOMPLETE_FILTER_JS = (
+    f'admin/js/vendor/jquery/jquery{_extra}.js',
+    f'admin/js/vendor/select2/select2.full{_extra}.js',
+    'admin/js/jquery.init.js',
+    'admin/js/autocomplete.js',
+    'js/admin/autocomplete_filter.js',
+)
+AUTOCOMPLETE_FILTER_CSS = (
+    f'admin/css/vendor/select2/select2{_extra}.css',
+    'admin/css/autocomplete.css',
+)
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """List filter on a relation that renders a server-searched
+    autocomplete box instead of one link per related row.
+
+    Options are fetched page by page from the admin autocomplete view, so
+    the changelist no longer grows with the related table. The related
+    model's admin needs ``search_fields``.
+    """
+    template = 'admin/admin_panel/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        self.field = model._meta.get_field(self.field_name)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        self.autocomplete_url = reverse(
+            f'{model_admin.admin_site.name}:autocomplete')
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        # Only the selected row is rendered
+        value = self.value()
+        if not value:
+            return []
+        try:
+            selected = self.field.related_model._default_manager.filter(
+                pk=value).first()
+        except (ValueError, ValidationError) as e:
+            raise IncorrectLookupParameters(e)
+        return [(value, str(selected))] if selected else []
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class LocationAutocompleteFilter(AutocompleteFilter):
+    title = 'locations'
+    field_name = 'locations'
+
+
+class AmenityAutocompleteFilter(AutocompleteFilter):
+    title = 'amenities'
+    field_name = 'amenities'
+
+
+class PropertyAutocompleteFilter(AutocompleteFilter):
+    title = 'property'
+    field_name = 'property'
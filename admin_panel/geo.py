@@ -0,0 +1,94 @@
+import math
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Stored precision, 9 characters is a cell of roughly 5 x 5 metres
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        coordinate, bounds = ((longitude, lon_range) if even
+                              else (latitude, lat_range))
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covered_radius(precision, latitude):
+    """Distance in km that the 3x3 block of cells around a point is
+    guaranteed to cover in every direction."""
+    height, width = cell_size(precision)
+    # Use the latitude closest to a pole within one cell, where a degree
+    # of longitude is shortest
+    edge = min(abs(latitude) + height, 90.0)
+    return KM_PER_DEGREE * min(height, width * math.cos(math.radians(edge)))
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells contain every point within
+    ``radius_km``, or None if the radius needs a full scan."""
+    precision = next(
+        (p for p in range(GEOHASH_PRECISION, 0, -1)
+         if covered_radius(p, latitude) >= radius_km), None)
+    if precision is None:
+        return None
+
+    height, width = cell_size(precision)
+    cells = set()
+    for d_lat in (-height, 0, height):
+        cell_lat = latitude + d_lat
+        if not -90 <= cell_lat <= 90:
+            continue
+        for d_lon in (-width, 0, width):
+            cell_lon = (longitude + d_lon + 180) % 360 - 180
+            cells.add(encode(cell_lat, cell_lon, precision))
+    return cells
+
+
+def cells_q(cells, field='geohash'):
+    # A range per prefix rather than LIKE, so a plain B-tree index is
+    # used on every backend and collation; 'z' is the last character
+    q = Q()
+    for cell in cells:
+        q |= Q(**{f'{field}__gte': cell, f'{field}__lt': cell + '{'})
+    return q
+
+
+def search_radii(latitude):
+    """Growing radii, each one fully covered by a coarser geohash."""
+    return [covered_radius(p, latitude) for p in range(7, 0, -1)]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2)
+         * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
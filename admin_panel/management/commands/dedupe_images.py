@@ -0,0 +1,140 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from admin_panel import content_store, read_model
+from admin_panel.models import PropertyImage
+from admin_panel.renditions import (
+    RENDITION_SIZES, rendition_name, renditions_exist)
+
+
+class Command(BaseCommand):
+    help = ('Move property images to content-addressed storage, so each '
+            'distinct file is stored once, and delete the copies left over')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the space that would be reclaimed '
+                                 'without changing anything')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of images updated per transaction')
+
+    def handle(self, *args, **options):
+        self.storage = PropertyImage._meta.get_field('image').storage
+        self.dry_run = options['dry_run']
+        # Old name -> (content name, digest, has renditions), or None when
+        # the file is missing, so every file is hashed once
+        self.blobs = {}
+        self.created = set()
+        self.deleted = set()
+        self.stats = dict.fromkeys(
+            ('images', 'updated', 'missing', 'bytes_written',
+             'files_deleted', 'bytes_deleted'), 0)
+
+        images = PropertyImage.objects.order_by('id').only(
+            'id', 'property', 'image', 'content_hash', 'has_renditions')
+        batch = []
+        for image in images.iterator(chunk_size=options['batch_size']):
+            batch.append(image)
+            if len(batch) >= options['batch_size']:
+                self.process(batch)
+                batch = []
+                self.stdout.write(f"{self.stats['images']} images checked...")
+        self.process(batch)
+
+        stats = self.stats
+        reclaimed = stats['bytes_deleted'] - stats['bytes_written']
+        self.stdout.write(
+            f"{stats['images']} images, {len(self.blobs)} files hashed, "
+            f"{stats['updated']} images moved, {stats['missing']} missing "
+            f"files")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would delete' if self.dry_run else 'Deleted'} "
+            f"{stats['files_deleted']} files "
+            f"({filesizeformat(stats['bytes_deleted'])}), wrote "
+            f"{filesizeformat(stats['bytes_written'])}, reclaimed "
+            f"{filesizeformat(max(reclaimed, 0))}"))
+
+    def process(self, batch):
+        updated = []
+        old_names = set()
+        for image in batch:
+            self.stats['images'] += 1
+            name = image.image.name
+            if name not in self.blobs:
+                self.blobs[name] = self.move(name)
+            blob = self.blobs[name]
+            if blob is None:
+                self.stats['missing'] += 1
+                continue
+            new_name, digest, has_renditions = blob
+            if new_name == name and image.content_hash == digest:
+                continue
+            image.image = new_name
+            image.content_hash = digest
+            image.has_renditions = has_renditions
+            updated.append(image)
+            if new_name != name:
+                old_names.add(name)
+
+        self.stats['updated'] += len(updated)
+        if self.dry_run:
+            for name in old_names:
+                self.delete(name)
+            return
+
+        with transaction.atomic():
+            PropertyImage.objects.bulk_update(
+                updated, ['image', 'content_hash', 'has_renditions'])
+            read_model.refresh(image.property_id for image in updated)
+
+        # Images of later batches may still use the old file
+        referenced = set(PropertyImage.objects.filter(
+            image__in=old_names).values_list('image', flat=True))
+        for name in old_names - referenced:
+            self.delete(name)
+
+    def move(self, name):
+        """Copy ``name`` and its renditions to the content-addressed blob
+        unless that blob exists."""
+        try:
+            with self.storage.open(name, 'rb') as f:
+                digest = content_store.hash_file(f)
+        except OSError:
+            return None
+        new_name = content_store.content_name(digest, name)
+        if new_name == name:
+            return new_name, digest, renditions_exist(self.storage, name)
+
+        if not self.exists(new_name):
+            self.copy(name, new_name)
+        for size in RENDITION_SIZES:
+            rendition = rendition_name(name, size)
+            new_rendition = rendition_name(new_name, size)
+            if self.exists(rendition) and not self.exists(new_rendition):
+                self.copy(rendition, new_rendition)
+        has_renditions = all(
+            self.exists(rendition_name(new_name, size))
+            for size in RENDITION_SIZES)
+        return new_name, digest, has_renditions
+
+    def exists(self, name):
+        return name in self.created or self.storage.exists(name)
+
+    def copy(self, source, target):
+        self.stats['bytes_written'] += self.storage.size(source)
+        self.created.add(target)
+        if not self.dry_run:
+            with self.storage.open(source, 'rb') as f:
+                self.storage.save(target, f)
+
+    def delete(self, name):
+        for file_name in [name] + [rendition_name(name, size)
+                                   for size in RENDITION_SIZES]:
+            if file_name in self.deleted or not self.storage.exists(
+                    file_name):
+                continue
+            self.deleted.add(file_name)
+            self.stats['files_deleted'] += 1
+            self.stats['bytes_deleted'] += self.storage.size(file_name)
+            if not self.dry_run:
+                self.storage.delete(file_name)
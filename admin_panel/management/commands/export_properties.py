@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand
+from admin_panel import export
+
+
+class Command(BaseCommand):
+    help = ('Export every property with its locations, amenities and image '
+            'URLs as CSV or JSON Lines')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(export.CONTENT_TYPES),
+                            default='csv', help='Output format')
+        parser.add_argument('--output',
+                            help='File to write (default: standard output)')
+        parser.add_argument('--chunk-size', type=int,
+                            default=export.CHUNK_SIZE,
+                            help='Properties read and prefetched at a time')
+        parser.add_argument('--base-url', default='',
+                            help='Prefix of the image URLs, such as '
+                                 'https://example.com')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        lines = export.export_lines(
+            options['format'], chunk_size=options['chunk_size'],
+            build_url=lambda url: base_url + url)
+        # newline='' keeps the \r\n line endings of the csv module as is
+        output = (open(options['output'], 'w', newline='')
+                  if options['output'] else sys.stdout)
+        count = -1 if options['format'] == 'csv' else 0
+        try:
+            for line in lines:
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {count} properties to {options['output']}"))
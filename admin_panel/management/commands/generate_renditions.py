@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from admin_panel import read_model
+from admin_panel.models import PropertyImage
+from admin_panel.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail renditions for existing property images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate images that already have '
+                                 'renditions')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of threads resizing images')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of images processed per batch')
+
+    def handle(self, *args, **options):
+        images = PropertyImage.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(has_renditions=False)
+
+        storage = PropertyImage._meta.get_field('image').storage
+        generated = failed = 0
+        batch = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for image in images.only('id', 'property', 'image').iterator(
+                    chunk_size=options['batch_size']):
+                batch.append(image)
+                if len(batch) < options['batch_size']:
+                    continue
+                done, errors = self.process(executor, storage, batch)
+                generated += done
+                failed += errors
+                batch = []
+                self.stdout.write(f"{generated} images processed...")
+            if batch:
+                done, errors = self.process(executor, storage, batch)
+                generated += done
+                failed += errors
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated renditions for {generated} images, {failed} failed"))
+
+    def process(self, executor, storage, batch):
+        results = executor.map(
+            lambda image: generate_renditions(storage, image.image.name),
+            batch)
+        succeeded = [image for image, ok in zip(batch, results) if ok]
+        with transaction.atomic():
+            PropertyImage.objects.filter(
+                id__in=[image.id for image in succeeded]).update(
+                has_renditions=True)
+            read_model.refresh(image.property_id for image in succeeded)
+        return len(succeeded), len(batch) - len(succeeded)
@@ -0,0 +1,96 @@
+from collections import defaultdict
+import json
+import statistics
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    'total': lambda row: row['p95_ms'],
+    'queries': lambda row: row['max_queries'],
+    'db': lambda row: row['avg_db_ms'],
+    'requests': lambda row: row['requests'],
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Summarize the request log written by InstrumentationMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.INSTRUMENTATION_LOG,
+                            help='Request log to read')
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS),
+                            default='total',
+                            help='Order views by p95 time, most queries, '
+                                 'average SQL time or request count')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of views and repeated queries '
+                                 'listed')
+
+    def handle(self, *args, **options):
+        if not options['log']:
+            raise CommandError("INSTRUMENTATION_LOG is not set")
+        records = defaultdict(list)
+        duplicates = defaultdict(lambda: {'requests': 0, 'max': 0,
+                                          'views': set()})
+        try:
+            with open(options['log']) as f:
+                for line in f:
+                    record = json.loads(line)
+                    view = record['view'] or record['path']
+                    records[view].append(record)
+                    for duplicate in record['duplicates']:
+                        entry = duplicates[duplicate['sql']]
+                        entry['requests'] += 1
+                        entry['max'] = max(entry['max'], duplicate['count'])
+                        entry['views'].add(view)
+        except FileNotFoundError:
+            raise CommandError(f"No request log at {options['log']}, set "
+                               f"INSTRUMENTATION_ENABLED = True first")
+
+        slow_ms = settings.INSTRUMENTATION_SLOW_REQUEST_MS
+        rows = []
+        for view, view_records in records.items():
+            totals = [r['total_ms'] for r in view_records]
+            rows.append({
+                'view': view,
+                'requests': len(view_records),
+                'p50_ms': statistics.median(totals),
+                'p95_ms': percentile(totals, 0.95),
+                'max_ms': max(totals),
+                'slow': sum(total >= slow_ms for total in totals),
+                'avg_queries': statistics.mean(
+                    r['queries'] for r in view_records),
+                'max_queries': max(r['queries'] for r in view_records),
+                'avg_db_ms': statistics.mean(
+                    r['db_ms'] for r in view_records),
+                'avg_template_ms': statistics.mean(
+                    r['template_ms'] for r in view_records),
+            })
+        rows.sort(key=SORT_KEYS[options['sort']], reverse=True)
+
+        self.stdout.write(
+            f"{'view':<45} {'reqs':>6} {'p50':>8} {'p95':>8} {'max':>8} "
+            f"{'slow':>5} {'queries':>11} {'db':>8} {'tmpl':>8}")
+        for row in rows[:options['top']]:
+            self.stdout.write(
+                f"{row['view'][:45]:<45} {row['requests']:>6} "
+                f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                f"{row['max_ms']:>8.1f} {row['slow']:>5} "
+                f"{row['avg_queries']:>5.1f}/{row['max_queries']:<5} "
+                f"{row['avg_db_ms']:>8.1f} {row['avg_template_ms']:>8.1f}")
+
+        if duplicates:
+            self.stdout.write(self.style.WARNING(
+                "\nRepeated queries (possible N+1):"))
+            ranked = sorted(duplicates.items(),
+                            key=lambda item: item[1]['requests'],
+                            reverse=True)
+            for sql, entry in ranked[:options['top']]:
+                self.stdout.write(
+                    f"{entry['requests']} requests, up to {entry['max']}x "
+                    f"in {', '.join(sorted(entry['views']))}:\n    {sql}")
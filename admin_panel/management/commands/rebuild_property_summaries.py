@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from admin_panel import read_model
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the PropertySummary row of every property'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=read_model.BATCH_SIZE,
+                            help='Number of properties rewritten per '
+                                 'transaction')
+
+    def handle(self, *args, **options):
+        total = read_model.rebuild(
+            options['batch_size'],
+            progress=lambda done: self.stdout.write(
+                f"{done} properties summarized..."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total} property summaries"))
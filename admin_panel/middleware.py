@@ -0,0 +1,145 @@
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone
+import json
+import logging
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Lists of placeholders differ in length from one request to the next
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+MAX_SQL_LENGTH = 500
+
+
+def query_signature(sql):
+    """SQL with the variable-length parts collapsed, so the same query
+    issued once per row shows up as one signature."""
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """Execute wrapper timing every query run on a connection."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total += duration
+            self.signatures[query_signature(sql)] += 1
+            if duration > self.slowest:
+                self.slowest = duration
+                self.slowest_sql = sql
+
+
+class InstrumentationMiddleware:
+    """Records query count, SQL time, repeated queries and the time spent
+    in the view and in template rendering for every request.
+
+    Enabled with INSTRUMENTATION_ENABLED. The timings are sent back in a
+    Server-Timing header, requests slower than
+    INSTRUMENTATION_SLOW_REQUEST_MS are logged, and every request is
+    appended to INSTRUMENTATION_LOG for the instrumentation_report
+    command. When disabled Django drops the middleware at startup.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request = getattr(
+            settings, 'INSTRUMENTATION_SLOW_REQUEST_MS', 500)
+        self.slow_query = getattr(
+            settings, 'INSTRUMENTATION_SLOW_QUERY_MS', 100)
+        self.duplicate_threshold = getattr(
+            settings, 'INSTRUMENTATION_DUPLICATE_THRESHOLD', 5)
+        self.log_path = getattr(settings, 'INSTRUMENTATION_LOG', None)
+        self.log_lock = threading.Lock()
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._instrumentation = timings = {}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        view_end = timings.get('view_end', end)
+        view_ms = (view_end - timings.get('view_start', start)) * 1000
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': self.view_name(request),
+            'status': response.status_code,
+            'total_ms': round((end - start) * 1000, 2),
+            'view_ms': round(view_ms, 2),
+            # TemplateResponse is rendered after the view has returned
+            'template_ms': round((end - view_end) * 1000, 2)
+            if 'view_end' in timings else 0.0,
+            'queries': recorder.count,
+            'db_ms': round(recorder.total * 1000, 2),
+            'slowest_query_ms': round(recorder.slowest * 1000, 2),
+            'slowest_query': (recorder.slowest_sql or '')[:MAX_SQL_LENGTH],
+            'duplicates': [
+                {'sql': sql[:MAX_SQL_LENGTH], 'count': count}
+                for sql, count in recorder.signatures.most_common(5)
+                if count >= self.duplicate_threshold
+            ],
+        }
+
+        response.headers['Server-Timing'] = ', '.join((
+            f'db;dur={record["db_ms"]};desc="{record["queries"]} queries"',
+            f'view;dur={record["view_ms"]}',
+            f'template;dur={record["template_ms"]}',
+            f'total;dur={record["total_ms"]}',
+        ))
+        self.report(record)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._instrumentation['view_end'] = time.perf_counter()
+        return response
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        return match.view_name or match._func_path
+
+    def report(self, record):
+        if (record['total_ms'] >= self.slow_request
+                or record['slowest_query_ms'] >= self.slow_query):
+            logger.warning(
+                "Slow request %s %s: %.0fms, %d queries in %.0fms, "
+                "slowest %.0fms: %s", record['method'], record['path'],
+                record['total_ms'], record['queries'], record['db_ms'],
+                record['slowest_query_ms'], record['slowest_query'])
+        for duplicate in record['duplicates']:
+            logger.warning(
+                "Query repeated %d times on %s: %s", duplicate['count'],
+                record['path'], duplicate['sql'])
+        if self.log_path:
+            line = json.dumps(record) + '\n'
+            with self.log_lock, open(self.log_path, 'a') as f:
+                f.write(line)
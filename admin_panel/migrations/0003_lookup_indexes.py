@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:15
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_property_ids(apps, schema_editor):
+    # Re-running the old migrator could import a property twice. The
+    # oldest row of each property_id is kept and takes over the images
+    # and links of the others, so property_id can become unique
+    Property = apps.get_model('admin_panel', 'Property')
+    PropertyImage = apps.get_model('admin_panel', 'PropertyImage')
+    duplicates = Property.objects.values('property_id').annotate(
+        rows=Count('id'), keep=Min('id')).filter(rows__gt=1)
+    for row in duplicates:
+        others = list(Property.objects.filter(
+            property_id=row['property_id']).exclude(
+            pk=row['keep']).values_list('pk', flat=True))
+        merge_properties(Property, row['keep'], others)
+        # The oldest featured image stays featured
+        featured = PropertyImage.objects.filter(
+            property_id=row['keep'], is_featured=True).order_by('id')
+        featured.exclude(pk__in=featured[:1].values('pk')).update(
+            is_featured=False)
+    if duplicates and schema_editor.connection.vendor == 'postgresql':
+        # Runs the deferred foreign key checks now, PostgreSQL refuses to
+        # alter a table with checks still pending
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+def merge_properties(Property, keep, others):
+    for field in Property._meta.many_to_many:
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        linked = set(through.objects.filter(**{source: keep}).values_list(
+            target, flat=True))
+        moved = set(through.objects.filter(
+            **{f'{source}__in': others}).values_list(target, flat=True))
+        through.objects.bulk_create(
+            through(**{f'{source}_id': keep, f'{target}_id': pk})
+            for pk in moved - linked)
+        through.objects.filter(**{f'{source}__in': others}).delete()
+    # Images, and rows of other apps such as import records
+    for relation in Property._meta.related_objects:
+        if relation.one_to_many:
+            relation.related_model.objects.filter(
+                **{f'{relation.field.name}__in': others}).update(
+                **{relation.field.name: keep})
+    Property.objects.filter(pk__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0002_propertyimage_has_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_property_ids,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='property',
+            name='property_id',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(
+                django.db.models.functions.text.Lower('name'),
+                models.F('type'), name='location_lower_name_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertyimage',
+            index=models.Index(
+                condition=models.Q(('is_featured', True)),
+                fields=['property'], name='propertyimage_featured_idx'),
+        ),
+    ]
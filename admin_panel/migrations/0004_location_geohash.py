@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+from django.db import migrations, models
+from admin_panel import geo
+
+
+def fill_geohash(apps, schema_editor):
+    Location = apps.get_model('admin_panel', 'Location')
+    locations = []
+    for location in Location.objects.only(
+            'id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        location.geohash = geo.encode(location.latitude, location.longitude)
+        locations.append(location)
+    Location.objects.bulk_update(locations, ['geohash'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0003_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True,
+                                   editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
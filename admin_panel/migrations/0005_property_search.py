@@ -0,0 +1,90 @@
+from django.db import migrations
+
+# The search index is not a model field: PostgreSQL keeps a generated
+# tsvector column with a GIN index, SQLite an FTS5 table maintained by
+# triggers. Both stay current for bulk inserts and raw SQL writes too.
+# See admin_panel/search.py for the queries that use them.
+
+POSTGRESQL_FORWARD = [
+    """
+    ALTER TABLE admin_panel_property ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX property_search_vector_idx
+    ON admin_panel_property USING gin (search_vector)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "ALTER TABLE admin_panel_property DROP COLUMN search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE admin_panel_property_fts USING fts5(
+        title, description,
+        content='admin_panel_property', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER admin_panel_property_fts_insert
+    AFTER INSERT ON admin_panel_property BEGIN
+        INSERT INTO admin_panel_property_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER admin_panel_property_fts_delete
+    AFTER DELETE ON admin_panel_property BEGIN
+        INSERT INTO admin_panel_property_fts(
+            admin_panel_property_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER admin_panel_property_fts_update
+    AFTER UPDATE ON admin_panel_property BEGIN
+        INSERT INTO admin_panel_property_fts(
+            admin_panel_property_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO admin_panel_property_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO admin_panel_property_fts(admin_panel_property_fts) "
+    "VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS admin_panel_property_fts_insert",
+    "DROP TRIGGER IF EXISTS admin_panel_property_fts_delete",
+    "DROP TRIGGER IF EXISTS admin_panel_property_fts_update",
+    "DROP TABLE IF EXISTS admin_panel_property_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0004_location_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRESQL_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:19
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0005_property_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='amenity',
+            index=models.Index(
+                django.db.models.functions.text.Lower('name'),
+                name='amenity_lower_name_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0006_amenity_lower_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertyimage',
+            name='content_hash',
+            field=models.CharField(
+                blank=True, db_index=True, default='', editable=False,
+                max_length=64),
+        ),
+    ]
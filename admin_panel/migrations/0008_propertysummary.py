@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0007_propertyimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertySummary',
+            fields=[
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='admin_panel.property')),
+                ('external_id', models.IntegerField(db_index=True)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('locations', models.JSONField(default=list)),
+                ('amenities', models.JSONField(default=list)),
+                ('featured_image', models.CharField(blank=True, max_length=100)),
+                ('featured_image_has_renditions', models.BooleanField(default=False)),
+                ('image_count', models.PositiveIntegerField(default=0)),
+                ('create_date', models.DateTimeField()),
+                ('update_date', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Property summaries',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:05
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def keep_one_featured_image(apps, schema_editor):
+    # The migrator used to feature every imported image. The oldest
+    # featured image of a property, the one listings show, stays featured
+    PropertyImage = apps.get_model('admin_panel', 'PropertyImage')
+    oldest = PropertyImage.objects.filter(is_featured=True).values(
+        'property').annotate(oldest=Min('id')).values('oldest')
+    PropertyImage.objects.filter(is_featured=True).exclude(
+        pk__in=oldest).update(is_featured=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0008_propertysummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_one_featured_image,
+                             migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='propertyimage',
+            name='propertyimage_featured_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='propertyimage',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('is_featured', True)),
+                fields=('property',), name='propertyimage_one_featured',
+                violation_error_message=(
+                    'This property already has a featured image.')),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0010_property_summary_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='propertyimage',
+            name='content_hash',
+            field=models.CharField(
+                blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
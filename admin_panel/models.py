@@ -1,8 +1,75 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
+import math
 import re
+from . import content_store, geo
+from .renditions import ensure_renditions, rendition_url
+
+
+class LocationQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_km):
+        """Locations within ``radius_km``, closest first, each with a
+        ``distance`` attribute in km.
+
+        Candidates are prefiltered on the indexed geohash column and then
+        checked with the exact haversine distance.
+        """
+        cells = geo.covering_cells(latitude, longitude, radius_km)
+        candidates = self if cells is None else self.filter(
+            geo.cells_q(cells))
+        locations = []
+        for location in candidates:
+            location.distance = geo.haversine_km(
+                latitude, longitude, location.latitude, location.longitude)
+            if location.distance <= radius_km:
+                locations.append(location)
+        return sorted(locations, key=lambda location: location.distance)
+
+    def nearest(self, latitude, longitude, count=10):
+        for radius in geo.search_radii(latitude):
+            locations = self.near(latitude, longitude, radius)
+            if len(locations) >= count:
+                return locations[:count]
+        return self.near(latitude, longitude, math.inf)[:count]
+
+
+class PropertyQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_km, limit=None):
+        """Properties with a location within ``radius_km``, closest first,
+        each with a ``distance`` attribute in km."""
+        locations = Location.objects.near(latitude, longitude, radius_km)
+        return self.with_distances(locations, limit)
+
+    def nearest(self, latitude, longitude, count=10):
+        for radius in geo.search_radii(latitude):
+            properties = self.near(latitude, longitude, radius, count)
+            if len(properties) >= count:
+                return properties
+        return self.near(latitude, longitude, math.inf, count)
+
+    def with_distances(self, locations, limit=None):
+        distances = {location.id: location.distance for location in locations}
+        links = Property.locations.through.objects.filter(
+            location_id__in=distances).values_list(
+            'property_id', 'location_id')
+        closest = {}
+        for property_id, location_id in links:
+            distance = distances[location_id]
+            if distance < closest.get(property_id, math.inf):
+                closest[property_id] = distance
+
+        # Cut to ``limit`` among the properties this queryset lets through
+        # only, or a filtered queryset would return fewer than it has
+        allowed = set(self.filter(id__in=closest).values_list(
+            'id', flat=True))
+        ids = sorted(allowed, key=closest.get)[:limit]
+        properties = list(self.filter(id__in=ids))
+        for obj in properties:
+            obj.distance = closest[obj.id]
+        return sorted(properties, key=lambda obj: obj.distance)
 
 
 class Location(models.Model):
@@ -14,9 +81,14 @@ class Location(models.Model):
     ])
     latitude = models.FloatField(blank=False, null=False)
     longitude = models.FloatField(blank=False, null=False)
+    # Precomputed spatial key for proximity search, see LocationQuerySet
+    geohash = models.CharField(max_length=12, blank=True, db_index=True,
+                               editable=False)
     create_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(null=True, blank=True)
 
+    objects = LocationQuerySet.as_manager()
+
     def clean(self):
         # Validate latitude and longitude ranges
         if self.latitude is not None and not (-90 <= self.latitude <= 90):
@@ -47,10 +119,16 @@ class Location(models.Model):
     def save(self, *args, **kwargs):
         if self.id:  # If the object already exists
             self.update_date = timezone.now()
+        self.geohash = geo.encode(self.latitude, self.longitude)
         super().save(*args, **kwargs)
 
     class Meta:
         verbose_name_plural = "Locations"
+        indexes = [
+            # Case-insensitive lookups by name, as done by the migrator
+            models.Index(Lower('name'), 'type',
+                         name='location_lower_name_type_idx'),
+        ]
 
 
 class Amenity(models.Model):
@@ -73,10 +151,14 @@ class Amenity(models.Model):
 
     class Meta:
         verbose_name_plural = "Amenities"
+        indexes = [
+            # Prefix search from the admin autocomplete widgets
+            models.Index(Lower('name'), name='amenity_lower_name_idx'),
+        ]
 
 
 class Property(models.Model):
-    property_id = models.IntegerField()
+    property_id = models.IntegerField(unique=True)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     locations = models.ManyToManyField(Location, blank=True)
@@ -84,6 +166,8 @@ class Property(models.Model):
     create_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(null=True, blank=True)
 
+    objects = PropertyQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -105,9 +189,72 @@ class PropertyImage(models.Model):
     caption = models.CharField(
         max_length=255, null=True, blank=True, default=None)  # Default to null
     is_featured = models.BooleanField(default=False)  # Default to False
+    has_renditions = models.BooleanField(default=False, editable=False)
+    # sha256 of the file, which is stored once under that hash
+    content_hash = models.CharField(
+        max_length=64, blank=True, default='', editable=False)
+
+    def rendition_url(self, size='thumb'):
+        return rendition_url(self.image.storage, self.image.name,
+                             self.has_renditions, size)
 
     def save(self, *args, **kwargs):
+        previous_image = None
         if self.id:  # If the object already exists
             self.updated_at = timezone.now()
+            previous_image = PropertyImage.objects.filter(
+                pk=self.pk).values_list('image', flat=True).first()
+
+        if self.image and not self.image._committed:
+            # A new upload: reuse the blob if the same content is stored
+            name, self.content_hash, _ = content_store.store(
+                self.image.storage, self.image.file, self.image.name)
+            self.image = name
 
         super().save(*args, **kwargs)
+
+        # Renditions are rebuilt whenever a new file was stored
+        if self.image and (not self.has_renditions
+                           or self.image.name != previous_image):
+            self.has_renditions = ensure_renditions(
+                self.image.storage, self.image.name)
+            PropertyImage.objects.filter(pk=self.pk).update(
+                has_renditions=self.has_renditions)
+
+    class Meta:
+        constraints = [
+            # Also the index the featured image of a property is read from
+            models.UniqueConstraint(
+                fields=['property'], condition=models.Q(is_featured=True),
+                name='propertyimage_one_featured',
+                violation_error_message=_(
+                    'This property already has a featured image.')),
+        ]
+
+
+class PropertySummary(models.Model):
+    """Denormalized read model of a Property.
+
+    One row per property with its own fields, the names of its locations
+    and amenities, its featured image and its image count, so listings
+    read a single table. Rows are written by admin_panel.read_model
+    whenever the property or anything it links to changes.
+    """
+    property = models.OneToOneField(
+        Property, on_delete=models.CASCADE, primary_key=True,
+        related_name='+')
+    # Property.property_id, the id of the crawled listing
+    external_id = models.IntegerField(db_index=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    locations = models.JSONField(default=list)
+    amenities = models.JSONField(default=list)
+    featured_image = models.CharField(max_length=100, blank=True)
+    featured_image_has_renditions = models.BooleanField(default=False)
+    image_count = models.PositiveIntegerField(default=0)
+    create_date = models.DateTimeField()
+    update_date = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Property summaries"
@@ -0,0 +1,139 @@
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+# Tables estimated at or above this many rows skip the exact COUNT(*)
+ESTIMATE_THRESHOLD = 100_000
+
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+
+def estimated_count(queryset):
+    """Row count of an unfiltered queryset from PostgreSQL planner
+    statistics, or None when no estimate is available."""
+    if not isinstance(queryset, QuerySet) or queryset.query.has_filters():
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # reltuples is -1 until the table has been vacuumed or analyzed
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the planner estimate instead of COUNT(*) for
+    large unfiltered tables. Small or filtered querysets are counted
+    exactly."""
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+            self.count_is_estimate = True
+            return estimate
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList with next/previous links that seek on a unique column
+    (``model_admin.keyset_field``) instead of OFFSET pages.
+
+    It is used for large tables in the default ordering; sorting by a
+    column, "show all" and small tables keep the numbered pages.
+    """
+    keyset_active = False
+    next_url = None
+    previous_url = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        # Filter, search and sort links must start again from the top
+        after = self.params.pop(AFTER_VAR, None)
+        before = self.params.pop(BEFORE_VAR, None)
+        self.filter_params.pop(AFTER_VAR, None)
+        self.filter_params.pop(BEFORE_VAR, None)
+        if (ORDER_VAR in self.params or self.query or self.show_all
+                or self.list_editable):
+            return super().get_results(request)
+        if after is None and before is None:
+            estimate = estimated_count(self.queryset)
+            if (estimate is None or estimate < ESTIMATE_THRESHOLD
+                    or self.page_num > 1):
+                return super().get_results(request)
+
+        field = self.model_admin.keyset_field
+        try:
+            to_python = self.lookup_opts.get_field(field).to_python
+            after = None if after is None else to_python(after)
+            before = None if before is None else to_python(before)
+        except ValidationError as e:
+            raise IncorrectLookupParameters(e)
+        queryset = self.queryset
+        if before is not None:
+            queryset = queryset.filter(**{f'{field}__lt': before}).order_by(
+                f'-{field}')
+        else:
+            if after is not None:
+                queryset = queryset.filter(**{f'{field}__gt': after})
+            queryset = queryset.order_by(field)
+        # One extra row tells whether there is another page
+        rows = list(queryset[:self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if before is not None:
+            rows.reverse()
+
+        if rows and (more or before is not None):
+            self.next_url = self.get_query_string(
+                {AFTER_VAR: getattr(rows[-1], field)}, remove=[PAGE_VAR])
+        if rows and (more if before is not None else after is not None):
+            self.previous_url = self.get_query_string(
+                {BEFORE_VAR: getattr(rows[0], field)}, remove=[PAGE_VAR])
+
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page)
+        self.keyset_active = True
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(self.next_url or self.previous_url)
+        self.paginator = paginator
+
+
+class LargeTableAdminMixin:
+    """Estimated counts, and keyset navigation when ``keyset_field`` is
+    set, for changelists over tables with millions of rows.
+
+    ``keyset_field`` has to be the admin's ``ordering`` too, or the list
+    changes order when it switches between numbered and keyset pages.
+    """
+    paginator = EstimatedCountPaginator
+    # The unfiltered total is a second COUNT(*) on every filtered page
+    show_full_result_count = False
+    keyset_field = None
+
+    def get_changelist(self, request, **kwargs):
+        if self.keyset_field:
+            return KeysetChangeList
+        return super().get_changelist(request, **kwargs)
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models import Count
+from .models import Property, PropertyImage, PropertySummary
+from . import summary_cache
+
+BATCH_SIZE = 1000
+UPDATE_FIELDS = [
+    'external_id', 'title', 'description', 'locations', 'amenities',
+    'featured_image', 'featured_image_has_renditions', 'image_count',
+    'create_date', 'update_date', 'refreshed_at',
+]
+
+
+def build(property_ids):
+    """Unsaved PropertySummary rows keyed by property id, in five queries
+    however many properties there are. Ids of deleted properties are left
+    out."""
+    rows = {
+        pk: PropertySummary(
+            property_id=pk, external_id=external_id, title=title,
+            description=description, create_date=create_date,
+            update_date=update_date, locations=[], amenities=[])
+        for pk, external_id, title, description, create_date, update_date
+        in Property.objects.filter(pk__in=property_ids).values_list(
+            'pk', 'property_id', 'title', 'description', 'create_date',
+            'update_date')
+    }
+    if not rows:
+        return rows
+
+    locations = Property.locations.through.objects.filter(
+        property_id__in=rows).order_by('location_id').values_list(
+        'property_id', 'location__name')
+    for pk, name in locations:
+        rows[pk].locations.append(name)
+
+    amenities = Property.amenities.through.objects.filter(
+        property_id__in=rows).order_by('amenity_id').values_list(
+        'property_id', 'amenity__name')
+    for pk, name in amenities:
+        rows[pk].amenities.append(name)
+
+    counts = PropertyImage.objects.filter(property_id__in=rows).values(
+        'property_id').annotate(count=Count('id')).values_list(
+        'property_id', 'count')
+    for pk, count in counts:
+        rows[pk].image_count = count
+
+    images = PropertyImage.objects.filter(
+        property_id__in=rows, is_featured=True).order_by('id').values_list(
+        'property_id', 'image', 'has_renditions')
+    # Ordered by id, so the oldest featured image wins
+    for pk, image, has_renditions in images:
+        if not rows[pk].featured_image:
+            rows[pk].featured_image = image
+            rows[pk].featured_image_has_renditions = has_renditions
+    return rows
+
+
+def refresh(property_ids):
+    """Rewrite the summary rows of ``property_ids``.
+
+    Runs in the caller's transaction, so the rows change together with the
+    data they summarize. The cached summaries are dropped once it commits.
+    """
+    property_ids = list({pk for pk in property_ids if pk is not None})
+    for start in range(0, len(property_ids), BATCH_SIZE):
+        chunk = property_ids[start:start + BATCH_SIZE]
+        rows = build(chunk)
+        PropertySummary.objects.bulk_create(
+            rows.values(), update_conflicts=True,
+            unique_fields=['property'], update_fields=UPDATE_FIELDS)
+        # Usually removed by the cascade already
+        deleted = set(chunk) - rows.keys()
+        if deleted:
+            PropertySummary.objects.filter(
+                property_id__in=deleted).delete()
+    if property_ids:
+        transaction.on_commit(
+            lambda: summary_cache.invalidate(property_ids))
+
+
+def rebuild(batch_size=BATCH_SIZE, progress=None):
+    """Rewrite every summary row, one transaction per batch. Returns the
+    number of rows written."""
+    total = 0
+    after = 0
+    while True:
+        property_ids = list(Property.objects.filter(pk__gt=after).order_by(
+            'pk').values_list('pk', flat=True)[:batch_size])
+        if not property_ids:
+            break
+        with transaction.atomic():
+            refresh(property_ids)
+        total += len(property_ids)
+        after = property_ids[-1]
+        if progress:
+            progress(total)
+    # Rows whose property is gone, should the cascade have been bypassed
+    PropertySummary.objects.exclude(
+        property_id__in=Property.objects.values('pk')).delete()
+    summary_cache.clear()
+    return total
+
+
+def as_summary(row):
+    """``row`` in the layout of the summary cache."""
+    return {
+        'locations': row.locations,
+        'amenities': row.amenities,
+        'featured_image': row.featured_image or None,
+        'featured_image_has_renditions': row.featured_image_has_renditions,
+    }
+
+
+def summaries(property_ids):
+    """Location names, amenity names and featured image of each property,
+    read from the PropertySummary table in one query."""
+    property_ids = set(property_ids)
+    rows = PropertySummary.objects.in_bulk(property_ids)
+    missing = property_ids - rows.keys()
+    if missing:
+        # Not written yet, such as before the first rebuild
+        rows.update(build(missing))
+    return {pk: as_summary(row) for pk, row in rows.items()}
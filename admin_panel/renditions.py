@@ -0,0 +1,68 @@
+from io import BytesIO
+import logging
+from pathlib import PurePosixPath
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Bounding box of each stored rendition. ``thumb`` covers every admin
+# preview (the largest is 180x180), ``medium`` is for full-width previews.
+RENDITION_SIZES = {
+    'thumb': (240, 240),
+    'medium': (800, 800),
+}
+RENDITION_QUALITY = 80
+
+
+def rendition_name(image_name, size):
+    path = PurePosixPath(image_name)
+    return str(path.parent / 'renditions' / size / f'{path.name}.jpg')
+
+
+def rendition_url(storage, image_name, has_renditions, size='thumb'):
+    if has_renditions:
+        return storage.url(rendition_name(image_name, size))
+    return storage.url(image_name)
+
+
+def renditions_exist(storage, image_name):
+    return all(storage.exists(rendition_name(image_name, size))
+               for size in RENDITION_SIZES)
+
+
+def ensure_renditions(storage, image_name):
+    """Like generate_renditions, but a blob shared with another image
+    keeps the renditions it already has."""
+    return (renditions_exist(storage, image_name)
+            or generate_renditions(storage, image_name))
+
+
+def generate_renditions(storage, image_name):
+    """Store a compressed JPEG of ``image_name`` for every size in
+    RENDITION_SIZES. Returns False if the file could not be decoded.
+    """
+    try:
+        with storage.open(image_name, 'rb') as image_file:
+            image = Image.open(image_file)
+            # Let the JPEG decoder downscale while reading, which is much
+            # faster than decoding the full-size original
+            image.draft('RGB', max(RENDITION_SIZES.values()))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot generate renditions for %s: %s",
+                       image_name, e)
+        return False
+
+    # Largest first, so every smaller size is scaled from the previous one
+    for size, box in sorted(RENDITION_SIZES.items(),
+                            key=lambda item: item[1], reverse=True):
+        image.thumbnail(box, Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=RENDITION_QUALITY,
+                   optimize=True, progressive=True)
+        name = rendition_name(image_name, size)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(buffer.getvalue()))
+    return True
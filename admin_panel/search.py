@@ -0,0 +1,68 @@
+import re
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Created by migration 0005: a generated tsvector column with a GIN index
+# on PostgreSQL, an FTS5 table kept in sync by triggers on SQLite
+SEARCH_VECTOR_COLUMN = 'search_vector'
+FTS_TABLE = 'admin_panel_property_fts'
+PROPERTY_TABLE = 'admin_panel_property'
+# Best match first, on querysets annotated by search_properties()
+RANK_ORDERING = (F('search_rank').desc(nulls_last=True), 'id')
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text)
+
+
+def search_expressions(vendor, text):
+    """(condition, rank) expressions for a full-text match of ``text``.
+
+    Every word has to match as a word prefix, so partial input from the
+    admin search box still finds results. A higher rank is a better match.
+    """
+    terms = search_terms(text)
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        tsquery = "to_tsquery('english', %s)"
+        return (
+            RawSQL(f'{PROPERTY_TABLE}.{SEARCH_VECTOR_COLUMN} @@ {tsquery}',
+                   [query], output_field=BooleanField()),
+            RawSQL(f'ts_rank({PROPERTY_TABLE}.{SEARCH_VECTOR_COLUMN}, '
+                   f'{tsquery})', [query], output_field=FloatField()),
+        )
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+        return (
+            RawSQL(f'{PROPERTY_TABLE}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                   f'WHERE {FTS_TABLE} MATCH %s)',
+                   [query], output_field=BooleanField()),
+            # bm25() is lower for better matches
+            RawSQL(f'(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+                   f'WHERE rowid = {PROPERTY_TABLE}.id '
+                   f'AND {FTS_TABLE} MATCH %s)',
+                   [query], output_field=FloatField()),
+        )
+    # No full-text index on other backends, fall back to a plain scan
+    return (
+        Q(title__icontains=text) | Q(description__icontains=text),
+        Value(0.0, output_field=FloatField()),
+    )
+
+
+def search_properties(queryset, text, property_id_match=True):
+    """Properties matching ``text``, annotated with ``search_rank`` and
+    ordered best match first.
+
+    A numeric ``text`` also matches the property_id, as the admin search
+    used to.
+    """
+    if not search_terms(text):
+        return queryset.none()
+    condition, rank = search_expressions(
+        connections[queryset.db].vendor, text)
+    if property_id_match and text.strip().isdigit():
+        condition = Q(condition) | Q(property_id=int(text))
+    return queryset.filter(condition).annotate(
+        search_rank=rank).order_by(*RANK_ORDERING)
@@ -0,0 +1,96 @@
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+from .models import Amenity, Location, Property, PropertyImage
+from . import read_model
+
+# Bulk writes (bulk_create, update, through rows deleted by a cascade)
+# send no signals; the code doing them refreshes the summaries itself.
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def property_changed(sender, instance, **kwargs):
+    read_model.refresh([instance.pk])
+
+
+@receiver(pre_save, sender=PropertyImage)
+def image_moving(sender, instance, **kwargs):
+    # Moving an image to another property changes both summaries
+    instance._previous_property_id = None
+    if instance.pk:
+        instance._previous_property_id = PropertyImage.objects.filter(
+            pk=instance.pk).values_list('property_id', flat=True).first()
+
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_delete, sender=PropertyImage)
+def image_changed(sender, instance, **kwargs):
+    read_model.refresh([
+        instance.property_id,
+        getattr(instance, '_previous_property_id', None),
+    ])
+
+
+def linked_property_ids(through, field_name, pk):
+    return list(through.objects.filter(**{field_name: pk}).values_list(
+        'property_id', flat=True))
+
+
+@receiver(pre_save, sender=Location)
+@receiver(pre_save, sender=Amenity)
+def name_changing(sender, instance, **kwargs):
+    # Only the name is summarized, other saves leave the summaries alone
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = sender.objects.filter(
+            pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Amenity)
+def name_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None
+                   and 'name' not in update_fields):
+        return
+    if instance.name == getattr(instance, '_previous_name', None):
+        return
+    through = (Property.locations.through if sender is Location
+               else Property.amenities.through)
+    read_model.refresh(linked_property_ids(
+        through, sender._meta.model_name, instance.pk))
+
+
+@receiver(pre_delete, sender=Location)
+@receiver(pre_delete, sender=Amenity)
+def related_deleting(sender, instance, **kwargs):
+    # The through rows are gone by the time post_delete runs
+    through = (Property.locations.through if sender is Location
+               else Property.amenities.through)
+    instance._linked_property_ids = linked_property_ids(
+        through, sender._meta.model_name, instance.pk)
+
+
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Amenity)
+def related_deleted(sender, instance, **kwargs):
+    read_model.refresh(getattr(instance, '_linked_property_ids', []))
+
+
+@receiver(m2m_changed, sender=Property.locations.through)
+@receiver(m2m_changed, sender=Property.amenities.through)
+def relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            read_model.refresh([instance.pk])
+        return
+    # location.property_set.add(...) and friends
+    field_name = instance._meta.model_name
+    if action == 'pre_clear':
+        instance._linked_property_ids = linked_property_ids(
+            sender, field_name, instance.pk)
+    elif action == 'post_clear':
+        read_model.refresh(
+            getattr(instance, '_linked_property_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        read_model.refresh(pk_set)
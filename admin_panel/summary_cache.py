@@ -0,0 +1,79 @@
+import threading
+from django.core.cache import caches
+
+# Alias in settings.CACHES, a database cache shared by the web server and
+# the management commands
+CACHE_ALIAS = 'property_summaries'
+# Bump when the summary layout changes so old entries are never read
+KEY_PREFIX = 'property-summary:v1:'
+# Keys per DELETE when invalidating
+BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def cache_key(property_id):
+    return f'{KEY_PREFIX}{property_id}'
+
+
+def _count(hits, misses):
+    with _lock:
+        _counters['hits'] += hits
+        _counters['misses'] += misses
+
+
+def stats():
+    """Hits and misses of this process since it started."""
+    with _lock:
+        return dict(_counters)
+
+
+def build_summaries(property_ids):
+    """Location names, amenity names and featured image of each property,
+    read from the PropertySummary table in one query."""
+    # Imported here, read_model invalidates this cache
+    from .read_model import summaries
+    return summaries(property_ids)
+
+
+def get_summaries(property_ids):
+    """Summaries keyed by property id, read from the cache with a single
+    get_many and built in bulk for the ones that are missing."""
+    cache = caches[CACHE_ALIAS]
+    property_ids = set(property_ids)
+    cached = cache.get_many([cache_key(pk) for pk in property_ids])
+    summaries = {}
+    for pk in property_ids:
+        summary = cached.get(cache_key(pk))
+        if summary is not None:
+            summaries[pk] = summary
+    missing = property_ids - summaries.keys()
+    _count(len(summaries), len(missing))
+    if missing:
+        built = build_summaries(missing)
+        cache.set_many({cache_key(pk): summary
+                        for pk, summary in built.items()})
+        summaries.update(built)
+    return summaries
+
+
+def attach_summaries(properties):
+    """Set ``summary`` on every property in ``properties``."""
+    properties = list(properties)
+    summaries = get_summaries(obj.pk for obj in properties)
+    for obj in properties:
+        obj.summary = summaries[obj.pk]
+    return properties
+
+
+def invalidate(property_ids):
+    keys = [cache_key(pk) for pk in set(property_ids) if pk is not None]
+    for start in range(0, len(keys), BATCH_SIZE):
+        caches[CACHE_ALIAS].delete_many(keys[start:start + BATCH_SIZE])
+
+
+def clear():
+    """Drop every summary, for bulk changes that cannot say which
+    properties they touched."""
+    caches[CACHE_ALIAS].clear()
@@ -0,0 +1,411 @@
+import io
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models.functions import Lower
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from .admin import PropertyAdmin
+from .models import (
+    Amenity, Location, Property, PropertyImage, PropertySummary)
+from . import bulk, read_model, summary_cache, uploads
+
+
+class PropertyChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'admin')
+        locations = [
+            Location.objects.create(name=f'City {i}', type='city',
+                                    latitude=i, longitude=i)
+            for i in range(3)
+        ]
+        amenities = [Amenity.objects.create(name=f'Amenity {i}')
+                     for i in range(4)]
+        images = []
+        for i in range(30):
+            obj = Property.objects.create(property_id=1000 + i,
+                                          title=f'Property {i}')
+            obj.locations.set(locations[:i % 3 + 1])
+            obj.amenities.set(amenities[:i % 4 + 1])
+            # Without files, so no renditions are attempted
+            images.append(PropertyImage(
+                property=obj, image=f'property_images/{i}.jpg',
+                is_featured=True))
+            images.append(PropertyImage(
+                property=obj, image=f'property_images/{i}-2.jpg'))
+        PropertyImage.objects.bulk_create(images)
+        read_model.rebuild()
+
+    def setUp(self):
+        summary_cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('admin:admin_panel_property_changelist')
+
+    def render(self, per_page):
+        with mock.patch.object(PropertyAdmin, 'list_per_page', per_page):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), per_page)
+        return response
+
+    def test_queries_do_not_grow_with_the_page_size(self):
+        # Warm the summary cache, then compare the second renders
+        self.render(5)
+        self.render(25)
+        with CaptureQueriesContext(connection) as small_page:
+            self.render(5)
+        queries = len(small_page)
+        with self.assertNumQueries(queries):
+            response = self.render(25)
+        self.assertContains(response, 'City 0, City 1')
+        self.assertContains(response, 'property_images/1.jpg')
+
+    def test_cold_summary_cache_costs_more_queries(self):
+        self.render(10)
+        with CaptureQueriesContext(connection) as warm:
+            self.render(10)
+        queries = len(warm)
+        summary_cache.clear()
+        with CaptureQueriesContext(connection) as cold:
+            self.render(10)
+        # One read of the summary table plus the writes to the cache
+        self.assertGreater(len(cold), queries)
+        with self.assertNumQueries(queries):
+            self.render(10)
+
+    def test_summaries_cold_and_warm(self):
+        property_ids = list(Property.objects.values_list('pk', flat=True))
+        before = summary_cache.stats()
+        cold = summary_cache.get_summaries(property_ids)
+        # A single get_many, nothing read from the summary table
+        with self.assertNumQueries(1):
+            warm = summary_cache.get_summaries(property_ids)
+        self.assertEqual(cold, warm)
+        after = summary_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 30)
+        self.assertEqual(after['hits'] - before['hits'], 30)
+        obj = Property.objects.get(property_id=1004)
+        self.assertEqual(cold[obj.pk], {
+            'locations': ['City 0', 'City 1'],
+            'amenities': ['Amenity 0'],
+            'featured_image': 'property_images/4.jpg',
+            'featured_image_has_renditions': False,
+        })
+
+    def test_missing_summaries_are_built(self):
+        obj = Property.objects.get(property_id=1004)
+        expected = read_model.summaries([obj.pk])
+        PropertySummary.objects.filter(property=obj).delete()
+        self.assertEqual(summary_cache.get_summaries([obj.pk]),
+                         {obj.pk: expected[obj.pk]})
+        self.assertContains(self.render(5), 'property_images/4.jpg')
+
+    def test_search_results_are_ranked(self):
+        weak = Property.objects.create(
+            property_id=1100, title='Harbour Lodge',
+            description=' '.join(f'word{i}' for i in range(50)))
+        strong = Property.objects.create(property_id=1101,
+                                         title='Harbour Harbour Harbour')
+        response = self.client.get(self.url, {'q': 'harbour'})
+        self.assertEqual(response.context['cl'].result_list, [strong, weak])
+        # Sorting on a column (property_id here) still wins
+        response = self.client.get(self.url, {'q': 'harbour', 'o': '2'})
+        self.assertEqual(response.context['cl'].result_list, [weak, strong])
+
+    def test_changes_invalidate_the_summary(self):
+        obj = Property.objects.get(property_id=1000)
+        summary_cache.get_summaries([obj.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.amenities.add(Amenity.objects.get(name='Amenity 3'))
+        summary = summary_cache.get_summaries([obj.pk])[obj.pk]
+        self.assertEqual(summary['amenities'], ['Amenity 0', 'Amenity 3'])
+
+    def test_only_renames_rewrite_the_summaries(self):
+        amenity = Amenity.objects.get(name='Amenity 0')
+        with mock.patch.object(read_model, 'refresh') as refresh:
+            amenity.save()
+            refresh.assert_not_called()
+            amenity.name = 'Pool'
+            amenity.save()
+            refresh.assert_called_once()
+
+
+class IndexUsageTests(TestCase):
+    """The lookups the migrator and the summaries depend on are served by
+    an index, not a scan of the table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        location = Location.objects.create(name='Dhaka', type='city',
+                                           latitude=23.8, longitude=90.4)
+        for i in range(50):
+            obj = Property.objects.create(property_id=2000 + i,
+                                          title=f'Property {i}')
+            obj.locations.add(location)
+        PropertyImage.objects.bulk_create(
+            PropertyImage(property=obj, image=f'property_images/{i}.jpg',
+                          is_featured=i % 2 == 0)
+            for i, obj in enumerate(Property.objects.all()))
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # The tables are tiny, where a scan is cheaper than any index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        # EXPLAIN QUERY PLAN on SQLite, which reports a full scan as
+        # "SCAN <table>" and an index lookup as "SEARCH <table> USING ..."
+        plan = queryset.explain()
+        self.assertNotRegex(plan, r'Seq Scan|\bSCAN\b')
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def test_property_id_lookup(self):
+        # The index of the unique constraint, named by the database
+        self.assertUsesIndex(Property.objects.filter(property_id=2010))
+
+    def test_lower_name_and_type_lookup(self):
+        self.assertUsesIndex(
+            Location.objects.alias(lower_name=Lower('name')).filter(
+                lower_name='dhaka', type='city'),
+            'location_lower_name_type_idx')
+
+    def test_featured_image_lookup(self):
+        obj = Property.objects.get(property_id=2010)
+        self.assertUsesIndex(
+            PropertyImage.objects.filter(property=obj, is_featured=True),
+            'propertyimage_one_featured')
+
+
+class ApiAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='staff',
+                                             is_staff=True)
+        cls.user = User.objects.create_user('user', password='user')
+        cls.obj = Property.objects.create(property_id=3000, title='Hotel')
+        cls.urls = [
+            reverse('api-property-list'),
+            reverse('api-property-summaries'),
+            reverse('api-properties-near') + '?lat=23.8&lon=90.4',
+            reverse('api-property-search') + '?q=hotel',
+            reverse('api-property-detail', args=[cls.obj.pk]),
+        ]
+
+    def assertStatus(self, status):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, status)
+
+    def test_anonymous(self):
+        self.assertStatus(401)
+
+    def test_not_staff(self):
+        self.client.force_login(self.user)
+        self.assertStatus(403)
+
+    def test_staff(self):
+        self.client.force_login(self.staff)
+        self.assertStatus(200)
+
+    @override_settings(API_PUBLIC=True)
+    def test_public(self):
+        self.assertStatus(200)
+
+
+class ProximitySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.wifi = Amenity.objects.create(name='Wifi')
+        for i in range(10):
+            location = Location.objects.create(
+                name=f'Place {i}', type='city', latitude=23.8 + i / 100,
+                longitude=90.4)
+            obj = Property.objects.create(property_id=4000 + i,
+                                          title=f'Property {i}')
+            obj.locations.add(location)
+            # Only the farther half has wifi
+            if i >= 5:
+                obj.amenities.add(cls.wifi)
+
+    def test_nearest_of_a_filtered_queryset(self):
+        properties = Property.objects.filter(
+            amenities=self.wifi).nearest(23.8, 90.4, 3)
+        self.assertEqual([obj.property_id for obj in properties],
+                         [4005, 4006, 4007])
+
+    def test_limit_applies_after_the_filter(self):
+        properties = Property.objects.filter(amenities=self.wifi).near(
+            23.8, 90.4, 100, limit=3)
+        self.assertEqual(len(properties), 3)
+        self.assertTrue(all(obj.distance > 5 for obj in properties))
+
+
+class LocationSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'admin')
+        for name, location_type in [('Dhaka', 'city'),
+                                    ('North Dhaka', 'city'),
+                                    ('Bangladesh', 'country')]:
+            Location.objects.create(name=name, type=location_type,
+                                    latitude=23.8, longitude=90.4)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def changelist_names(self, term):
+        response = self.client.get(
+            reverse('admin:admin_panel_location_changelist'), {'q': term})
+        return sorted(obj.name for obj in response.context['cl'].result_list)
+
+    def autocomplete_names(self, term):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'admin_panel', 'model_name': 'property',
+            'field_name': 'locations', 'term': term})
+        return [result['text'] for result in response.json()['results']]
+
+    def test_changelist_searches_name_and_type_substrings(self):
+        self.assertEqual(self.changelist_names('dhaka'),
+                         ['Dhaka', 'North Dhaka'])
+        self.assertEqual(self.changelist_names('country'), ['Bangladesh'])
+
+    def test_autocomplete_searches_name_prefixes(self):
+        self.assertEqual(self.autocomplete_names('dha'), ['Dhaka (City)'])
+        self.assertEqual(self.autocomplete_names('country'), [])
+
+
+class BulkImageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.obj = Property.objects.create(property_id=5000, title='Hotel')
+        PropertyImage.objects.bulk_create(
+            PropertyImage(property=cls.obj, image=f'property_images/{i}.jpg',
+                          is_featured=i == 0)
+            for i in range(5))
+        read_model.refresh([cls.obj.pk])
+
+    def test_delete_images_refreshes_the_summary(self):
+        images = PropertyImage.objects.filter(property=self.obj)
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = bulk.delete_images(images.exclude(
+                image='property_images/4.jpg'))
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(images.values_list('image', flat=True)),
+                         ['property_images/4.jpg'])
+        summary = PropertySummary.objects.get(property=self.obj)
+        self.assertEqual(summary.image_count, 1)
+        self.assertEqual(summary.featured_image, '')
+
+
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'admin')
+        cls.obj = Property.objects.create(property_id=6000, title='Hotel')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=directory.name,
+            IMAGE_UPLOAD_DIR=Path(directory.name) / 'uploads')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.user)
+        self.start_url = reverse('admin:admin_panel_property_upload_start',
+                                 args=[self.obj.pk])
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+
+    def start(self, size=None):
+        response = self.client.post(
+            self.start_url,
+            {'name': 'room.png', 'size': size or len(self.content)},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            f'{self.start_url}{upload_id}/', data,
+            content_type='application/octet-stream',
+            headers={'Upload-Offset': str(offset)})
+
+    def test_last_chunk_stores_the_file(self):
+        upload_id = self.start()
+        half = len(self.content) // 2
+        self.assertEqual(self.put(upload_id, 0, self.content[:half]).json()[
+            'offset'], half)
+        # The same chunk again is refused, not appended twice
+        response = self.put(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+
+        self.put(upload_id, half, self.content[half:])
+        upload = uploads.Upload.load(upload_id, self.obj.pk, self.user.pk)
+        self.assertTrue(upload.stored)
+        self.assertFalse(upload.path.exists())
+        self.assertEqual(self.put(upload_id, half, b'x').status_code, 409)
+
+        # Completing only writes rows, the file is not read again
+        with mock.patch.object(uploads.content_store, 'store') as store:
+            response = self.client.post(
+                f'{self.start_url}complete/', {'ids': [upload_id]},
+                content_type='application/json')
+        store.assert_not_called()
+        self.assertEqual(response.json()['errors'], {})
+        image = PropertyImage.objects.get(property=self.obj)
+        self.assertEqual(image.image.name, upload.meta['image'])
+        self.assertTrue(image.is_featured)
+        self.assertFalse(upload.meta_path.exists())
+
+    def upload(self, content):
+        upload_id = self.start(len(content))
+        self.put(upload_id, 0, content)
+        return uploads.Upload.load(upload_id, self.obj.pk, self.user.pk)
+
+    def test_sweep_only_deletes_the_files_an_upload_created(self):
+        storage = PropertyImage._meta.get_field('image').storage
+        first = self.upload(self.content)
+        second = self.upload(self.content)
+        self.assertEqual((first.meta['created'], second.meta['created']),
+                         (True, False))
+        os.utime(first.meta_path, (0, 0))
+        uploads.sweep()
+        # The upload still in progress refers to it
+        self.assertFalse(first.meta_path.exists())
+        self.assertTrue(storage.exists(second.meta['image']))
+
+        os.utime(second.meta_path, (0, 0))
+        uploads.sweep()
+        self.assertTrue(storage.exists(second.meta['image']))
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'blue').save(buffer, 'PNG')
+        third = self.upload(buffer.getvalue())
+        os.utime(third.meta_path, (0, 0))
+        uploads.sweep()
+        self.assertFalse(storage.exists(third.meta['image']))
+
+    def test_not_an_image(self):
+        upload_id = self.start()
+        response = self.put(upload_id, 0, b'x' * len(self.content))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            f'{self.start_url}complete/', {'ids': [upload_id]},
+            content_type='application/json')
+        self.assertEqual(response.json()['errors'],
+                         {upload_id: 'The file is not an image.'})
+        self.assertFalse(PropertyImage.objects.exists())
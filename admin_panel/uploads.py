@@ -0,0 +1,360 @@
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods
+from PIL import Image
+from . import bulk, content_store, read_model
+from .models import PropertyImage
+from .renditions import ensure_renditions
+
+# Bytes read from the request and written to disk at a time
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+    def response(self):
+        return JsonResponse({'error': str(self), **self.details},
+                            status=self.status)
+
+
+def upload_dir():
+    return Path(getattr(settings, 'IMAGE_UPLOAD_DIR',
+                        settings.BASE_DIR / 'uploads'))
+
+
+def chunk_size():
+    return getattr(settings, 'IMAGE_UPLOAD_CHUNK_SIZE', 1024 * 1024)
+
+
+def max_size():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+class Upload:
+    """A file sent in chunks, appended to ``<id>.part`` in the upload
+    directory as they arrive. ``<id>.json`` records who started it, for
+    which property, and the name and size of the file.
+
+    The size of the part file is the offset the next chunk starts at, so
+    an upload interrupted at any point resumes from what reached the disk.
+    Once the last chunk has arrived the file is stored under its content
+    hash, its stored name is added to ``<id>.json``, with whether this
+    upload created that blob, and the part file is deleted.
+    """
+
+    def __init__(self, upload_id, meta):
+        self.id = upload_id
+        self.meta = meta
+        self.path = upload_dir() / f'{upload_id}.part'
+        self.meta_path = upload_dir() / f'{upload_id}.json'
+
+    @classmethod
+    def start(cls, property_id, user_id, name, size):
+        name = os.path.basename(str(name or ''))
+        if not name:
+            raise UploadError('The file needs a name.')
+        try:
+            validate_image_file_extension(File(None, name))
+        except ValidationError as e:
+            raise UploadError(e.messages[0])
+        if not isinstance(size, int) or not 0 < size <= max_size():
+            raise UploadError(
+                f'Files must be between 1 byte and {max_size()} bytes.')
+
+        sweep()
+        upload = cls(uuid.uuid4().hex, {
+            'property_id': property_id, 'user_id': user_id,
+            'name': name, 'size': size})
+        upload_dir().mkdir(parents=True, exist_ok=True)
+        upload.path.touch()
+        upload.save_meta()
+        return upload
+
+    @classmethod
+    def load(cls, upload_id, property_id, user_id):
+        try:
+            upload_id = uuid.UUID(upload_id).hex
+            upload = cls(upload_id, json.loads(
+                (upload_dir() / f'{upload_id}.json').read_text()))
+        except (ValueError, OSError):
+            raise UploadError('Unknown upload.', 404)
+        # Someone else's upload is as good as missing
+        if (upload.meta['property_id'], upload.meta['user_id']) != (
+                property_id, user_id):
+            raise UploadError('Unknown upload.', 404)
+        return upload
+
+    def save_meta(self):
+        # Written aside and renamed, so a reader never sees half of it
+        path = self.meta_path.with_suffix('.tmp')
+        path.write_text(json.dumps(self.meta))
+        os.replace(path, self.meta_path)
+
+    @property
+    def stored(self):
+        return 'image' in self.meta
+
+    @property
+    def offset(self):
+        if self.stored:
+            return self.size
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            raise UploadError('Unknown upload.', 404)
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    @contextmanager
+    def locked(self):
+        """The part file, open and exclusively locked, with ``meta``
+        read again as it may have changed while waiting for the lock.
+        None once the file is stored."""
+        try:
+            part = open(self.path, 'r+b')
+        except FileNotFoundError:
+            part = None
+        try:
+            if part is not None:
+                fcntl.flock(part, fcntl.LOCK_EX)
+            try:
+                self.meta = json.loads(self.meta_path.read_text())
+            except OSError:
+                raise UploadError('Unknown upload.', 404)
+            if part is None and not self.stored:
+                raise UploadError('Unknown upload.', 404)
+            yield None if self.stored else part
+        finally:
+            if part is not None:
+                part.close()
+
+    def append(self, offset, stream, length):
+        """Write ``length`` bytes of ``stream`` at ``offset``, which has to
+        be where the part file ends, and store the file if that was its
+        last chunk. Returns the new offset.
+
+        The part file stays locked from the offset check to the end of
+        the write, so two requests sending the same chunk cannot both
+        append it.
+        """
+        with self.locked() as part:
+            end = self.size if part is None else part.seek(0, os.SEEK_END)
+            if part is None or offset != end:
+                raise UploadError('The upload is at another offset.', 409,
+                                  offset=end)
+            if offset + length > self.size:
+                raise UploadError('The chunk ends past the end of the file.')
+            remaining = length
+            while remaining:
+                block = stream.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    # Connection dropped, keep what arrived
+                    break
+                part.write(block)
+                remaining -= len(block)
+            part.flush()
+            if part.tell() == self.size:
+                self.store(part)
+        return self.offset
+
+    def store(self, part):
+        """Check that the complete ``part`` file is an image and store it
+        under its content hash, with its renditions."""
+        storage = PropertyImage._meta.get_field('image').storage
+        part.seek(0)
+        try:
+            Image.open(part).verify()
+        except Exception:
+            raise UploadError('The file is not an image.')
+        name, digest, created = content_store.store(
+            storage, File(part), self.meta['name'])
+        self.meta.update(image=name, content_hash=digest, created=created,
+                         has_renditions=ensure_renditions(storage, name))
+        self.save_meta()
+        self.path.unlink()
+
+    def discard(self):
+        for path in (self.path, self.meta_path):
+            path.unlink(missing_ok=True)
+
+    def as_json(self):
+        return {'id': self.id, 'name': self.meta['name'],
+                'offset': self.offset, 'size': self.size}
+
+
+def sweep():
+    """Delete the uploads that were not finished in IMAGE_UPLOAD_EXPIRY
+    seconds, and the stored files they created that no image came to use.
+
+    A blob that already existed, or that another upload still in progress
+    refers to, is kept.
+    """
+    expiry = getattr(settings, 'IMAGE_UPLOAD_EXPIRY', 24 * 60 * 60)
+    cutoff = time.time() - expiry
+    try:
+        paths = list(upload_dir().iterdir())
+    except FileNotFoundError:
+        return
+    created = set()
+    live = set()
+    for path in paths:
+        try:
+            expired = path.stat().st_mtime < cutoff
+            if path.suffix == '.json':
+                meta = json.loads(path.read_text())
+                if not expired:
+                    live.add(meta.get('image'))
+                elif meta.get('created'):
+                    created.add(meta['image'])
+            if expired:
+                path.unlink()
+        except (OSError, ValueError):
+            pass
+    bulk.delete_unused_files(created - live)
+
+
+def image(upload):
+    """The unsaved PropertyImage of a finished upload."""
+    if not upload.stored:
+        if not upload.complete:
+            raise UploadError('The upload is not finished.', 409,
+                              offset=upload.offset)
+        # Complete but not stored, as when the worker stopped between
+        # the last chunk and storing it
+        with upload.locked() as part:
+            if part is not None:
+                upload.store(part)
+    return PropertyImage(
+        property_id=upload.meta['property_id'],
+        image=upload.meta['image'],
+        caption=upload.meta['name'],
+        has_renditions=upload.meta['has_renditions'],
+        content_hash=upload.meta['content_hash'],
+    )
+
+
+def finish(property_id, uploads):
+    """Create the images of the finished ``uploads`` in one batch. Their
+    files were stored as their last chunks arrived, so this only writes
+    rows.
+
+    Returns the created images and the error of every upload that could
+    not be used, by upload id. The created uploads are deleted; the others
+    stay so they can be resumed or retried.
+    """
+    images = {}
+    errors = {}
+    for upload in uploads:
+        try:
+            images[upload.id] = image(upload)
+        except UploadError as e:
+            errors[upload.id] = str(e)
+    with transaction.atomic():
+        PropertyImage.objects.bulk_create(images.values())
+        # Only features an image if the property had none
+        bulk.feature_first_images([property_id])
+        read_model.refresh([property_id])
+    for upload in uploads:
+        if upload.id in images:
+            upload.discard()
+    return list(images.values()), errors
+
+
+def json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise UploadError('The request body is not JSON.')
+    if not isinstance(data, dict):
+        raise UploadError('The request body is not a JSON object.')
+    return data
+
+
+@require_http_methods(['POST'])
+def start_view(request, obj):
+    """Start the upload of one file, described by ``name`` and ``size``
+    in a JSON body."""
+    try:
+        data = json_body(request)
+        upload = Upload.start(obj.pk, request.user.pk, data.get('name'),
+                              data.get('size'))
+    except UploadError as e:
+        return e.response()
+    return JsonResponse({**upload.as_json(), 'chunk_size': chunk_size()},
+                        status=201)
+
+
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def chunk_view(request, obj, upload_id):
+    """GET reports how much of the upload has arrived, PUT appends the
+    request body at the ``Upload-Offset`` header and DELETE cancels it."""
+    try:
+        upload = Upload.load(upload_id, obj.pk, request.user.pk)
+        if request.method == 'DELETE':
+            upload.discard()
+            return HttpResponse(status=204)
+        if request.method == 'PUT':
+            try:
+                offset = int(request.headers['Upload-Offset'])
+                length = int(request.headers['Content-Length'])
+            except (KeyError, ValueError):
+                raise UploadError(
+                    'Upload-Offset and Content-Length are required.')
+            # Read from the request stream, the body is never held in
+            # memory as a whole. The last chunk also stores the file, so
+            # completing the uploads only writes rows
+            upload.append(offset, request, length)
+        return JsonResponse(upload.as_json())
+    except UploadError as e:
+        return e.response()
+
+
+@require_http_methods(['POST'])
+def complete_view(request, obj):
+    """Create the images of the uploads listed in ``ids``."""
+    try:
+        ids = json_body(request).get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise UploadError("'ids' must be a list of upload ids.")
+        uploads = []
+        errors = {}
+        for upload_id in ids:
+            try:
+                uploads.append(
+                    Upload.load(str(upload_id), obj.pk, request.user.pk))
+            except UploadError as e:
+                errors[str(upload_id)] = str(e)
+    except UploadError as e:
+        return e.response()
+
+    images, failed = finish(obj.pk, uploads)
+    errors.update(failed)
+    return JsonResponse({
+        'images': [
+            {'id': image.id, 'caption': image.caption,
+             'url': image.image.url, 'thumbnail_url': image.rendition_url()}
+            for image in images
+        ],
+        'errors': errors,
+    })
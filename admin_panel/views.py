@@ -1,4 +1,25 @@
-from django.http import HttpResponse
+import mimetypes
+import os
+import posixpath
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+# MEDIA_ROOT is the project directory, only these folders are public
+MEDIA_PUBLIC_PREFIXES = ('property_images/',)
+# Originals are never overwritten (storage picks a new name instead),
+# renditions are regenerated in place
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RENDITION_MAX_AGE = 24 * 60 * 60
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
 
 
 def welcome(request):
@@ -7,3 +28,127 @@ def welcome(request):
         <p>To log in, visit:
                     <a href="/admin/">http://127.0.0.1:8000/admin/</a></p>
     """)
+
+
+def parse_range(header, size):
+    """(start, end) of a single ``bytes=`` range, end inclusive. None
+    when the header should be ignored, ValueError when it can't be
+    satisfied."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed or multiple ranges: serve the whole file
+        return None
+    start, end = match.groups()
+    if start == '':
+        # Suffix range, the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve a property image from MEDIA_ROOT.
+
+    Answers conditional requests with 304, single byte ranges with 206
+    and streams the file in chunks. With MEDIA_SENDFILE_HEADER set the
+    body is left to the front end server (X-Sendfile or
+    X-Accel-Redirect).
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if not path.startswith(MEDIA_PUBLIC_PREFIXES):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(request, full_path, path, stat.st_size,
+                                 etag, last_modified)
+
+    if response.status_code == 416:
+        return response
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    if '/renditions/' in path:
+        patch_cache_control(response, public=True,
+                            max_age=RENDITION_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True,
+                            max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+def file_response(request, full_path, path, size, etag, last_modified):
+    content_type = (mimetypes.guess_type(full_path)[0]
+                    or 'application/octet-stream')
+
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == 'X-Accel-Redirect':
+            # Path of an nginx "internal" location aliased to MEDIA_ROOT
+            response.headers[sendfile_header] = (
+                settings.MEDIA_SENDFILE_URL + path)
+        else:
+            response.headers[sendfile_header] = full_path
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range in (
+            etag, http_date(last_modified))):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response.headers['Content-Length'] = size
+    elif byte_range is None:
+        # Handed to the server's wsgi.file_wrapper, which uses sendfile()
+        # where it can
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end), status=206,
+            content_type=content_type)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.headers['Content-Length'] = end - start + 1
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,360 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import traceback
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+from admin_panel import bulk, content_store, geo, read_model
+from admin_panel.models import Location, Property, PropertyImage
+from admin_panel.renditions import ensure_renditions
+from data_migration_cli.location_resolver import LOCATION_LOCK_ID
+from data_migration_cli.metrics import MigrationMetrics
+
+# Serializes COPY imports, they share the staging tables
+COPY_IMPORT_LOCK_ID = 727002
+STAGING_TABLE = 'scrapy_import_rows'
+FILES_TABLE = 'scrapy_import_files'
+
+LOCATION = Location._meta.db_table
+PROPERTY = Property._meta.db_table
+PROPERTY_LOCATIONS = Property.locations.through._meta.db_table
+PROPERTY_IMAGE = PropertyImage._meta.db_table
+
+SOURCE_QUERY = """
+    SELECT id::bigint, country_name::text, city_name::text, title::text,
+           latitude::float8, longitude::float8, image_paths::text
+    FROM properties
+"""
+
+CREATE_STAGING_SQL = f"""
+    DROP TABLE IF EXISTS {STAGING_TABLE}, {FILES_TABLE};
+    CREATE UNLOGGED TABLE {STAGING_TABLE} (
+        id bigint PRIMARY KEY,
+        country_name text,
+        city_name text,
+        title text,
+        latitude float8,
+        longitude float8,
+        image_paths text
+    );
+    CREATE UNLOGGED TABLE {FILES_TABLE} (
+        source_path text PRIMARY KEY,
+        image text,
+        content_hash text,
+        has_renditions boolean
+    );
+"""
+
+# First coordinates seen for each (lower(name), type) that has no row yet
+INSERT_LOCATIONS_SQL = f"""
+    INSERT INTO {LOCATION} (name, type, latitude, longitude, geohash,
+                            create_date)
+    SELECT name, type, latitude, longitude, '', now()
+    FROM (
+        SELECT DISTINCT ON (lower(name), type)
+               name, type, latitude, longitude
+        FROM (
+            SELECT country_name AS name, 'country' AS type,
+                   latitude, longitude, id
+            FROM {STAGING_TABLE} WHERE country_name <> ''
+            UNION ALL
+            SELECT city_name, 'city', latitude, longitude, id
+            FROM {STAGING_TABLE} WHERE city_name <> ''
+        ) named
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ORDER BY lower(name), type, id
+    ) candidates
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {LOCATION} l
+        WHERE lower(l.name) = lower(candidates.name)
+          AND l.type = candidates.type
+    )
+    RETURNING id, latitude, longitude
+"""
+
+UPSERT_PROPERTIES_SQL = f"""
+    WITH upserted AS (
+        INSERT INTO {PROPERTY} (property_id, title, description,
+                                create_date)
+        SELECT id, coalesce(title, ''), '', now() FROM {STAGING_TABLE}
+        ON CONFLICT (property_id) DO UPDATE
+            SET title = EXCLUDED.title, update_date = now()
+            WHERE {PROPERTY}.title IS DISTINCT FROM EXCLUDED.title
+        RETURNING xmax = 0 AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted),
+           count(*) FILTER (WHERE NOT inserted)
+    FROM upserted
+"""
+
+STAGED_PROPERTIES_SQL = f"""
+    SELECT p.id FROM {STAGING_TABLE} s
+    JOIN {PROPERTY} p ON p.property_id = s.id
+"""
+
+# The oldest location wins when names only differ by case, as in
+# LocationResolver
+DESIRED_LINKS_SQL = f"""
+    SELECT p.id AS property_id, l.id AS location_id
+    FROM {STAGING_TABLE} s
+    JOIN {PROPERTY} p ON p.property_id = s.id
+    JOIN (
+        SELECT DISTINCT ON (lower(name), type)
+               id, lower(name) AS lower_name, type
+        FROM {LOCATION}
+        ORDER BY lower(name), type, id
+    ) l ON (l.type = 'country' AND l.lower_name = lower(s.country_name))
+        OR (l.type = 'city' AND l.lower_name = lower(s.city_name))
+"""
+
+LINK_LOCATIONS_SQL = f"""
+    WITH desired AS ({DESIRED_LINKS_SQL}),
+    removed AS (
+        DELETE FROM {PROPERTY_LOCATIONS} t
+        USING {STAGING_TABLE} s, {PROPERTY} p
+        WHERE p.property_id = s.id AND t.property_id = p.id
+          AND NOT EXISTS (
+              SELECT 1 FROM desired d
+              WHERE d.property_id = t.property_id
+                AND d.location_id = t.location_id)
+        RETURNING 1
+    ),
+    added AS (
+        INSERT INTO {PROPERTY_LOCATIONS} (property_id, location_id)
+        SELECT property_id, location_id FROM desired
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM added), (SELECT count(*) FROM removed)
+"""
+
+# Image paths of the staged rows with no image yet. Images are matched
+# on (property, file name) like the ORM path
+NEW_IMAGES_CTE = f"""
+    paths AS (
+        SELECT p.id AS property_id, trim(path) AS source_path,
+               regexp_replace(trim(path), '^.*/', '') AS file_name
+        FROM {STAGING_TABLE} s
+        JOIN {PROPERTY} p ON p.property_id = s.id
+        CROSS JOIN LATERAL unnest(string_to_array(s.image_paths, ','))
+            AS path
+        WHERE trim(path) <> ''
+    ),
+    new AS (
+        SELECT * FROM paths
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {PROPERTY_IMAGE} i
+            WHERE i.property_id = paths.property_id
+              AND i.caption = paths.file_name)
+    )
+"""
+
+NEW_FILES_SQL = f"""
+    WITH {NEW_IMAGES_CTE}
+    SELECT DISTINCT source_path FROM new
+"""
+
+# Only images whose file is stored get a row, with its final name
+INSERT_IMAGES_SQL = f"""
+    WITH {NEW_IMAGES_CTE},
+    inserted AS (
+        INSERT INTO {PROPERTY_IMAGE} (property_id, image, caption,
+                                      is_featured, has_renditions,
+                                      content_hash, created_at)
+        SELECT n.property_id, f.image, n.file_name, false,
+               f.has_renditions, f.content_hash, now()
+        FROM new n
+        JOIN {FILES_TABLE} f ON f.source_path = n.source_path
+        RETURNING property_id
+    )
+    SELECT count(*), coalesce(array_agg(DISTINCT property_id), '{{}}')
+    FROM inserted
+"""
+
+
+class CopyImporter:
+    """Set-based import for when both databases are PostgreSQL.
+
+    The Scrapy rows are streamed with COPY into an unlogged staging table
+    and merged with a handful of SQL statements: missing locations,
+    property upsert by property_id, location links and image rows. Python
+    only touches the new locations (for their geohash) and the image
+    files. The merge commits first, the files are then copied with no
+    transaction open, and the image rows are inserted from the stored
+    files in a short second transaction. A committed image row always has
+    its file; a run that stops while copying leaves images missing, which
+    the next run adds, skipping the content already stored.
+    """
+
+    def __init__(self, stdout, style, scrapy_source, image_base_path,
+                 dry_run=False, image_workers=4, report_path=None):
+        self.stdout = stdout
+        self.style = style
+        self.scrapy_source = scrapy_source
+        self.image_base_path = image_base_path
+        self.dry_run = dry_run
+        self.image_workers = image_workers
+        self.metrics = MigrationMetrics(stdout, report_path)
+        self.counts = self.metrics.counters
+
+    def stage(self, name, function, *args):
+        with self.metrics.timer(name):
+            return function(*args)
+
+    def run(self):
+        self.metrics.start(engine='copy', dry_run=self.dry_run)
+        try:
+            self.merge()
+        except Exception as e:
+            # One transaction, so a bad row fails the whole import
+            self.metrics.error('run', e, traceback=traceback.format_exc())
+            self.metrics.finish()
+            raise
+
+    def merge(self):
+        with connection.cursor() as cursor:
+            # Held for the whole run, across its transactions, as the
+            # staging tables outlive the first one
+            cursor.execute("SELECT pg_advisory_lock(%s)",
+                           [COPY_IMPORT_LOCK_ID])
+            try:
+                self.merge_rows(cursor)
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s)",
+                               [COPY_IMPORT_LOCK_ID])
+        self.report()
+
+    def merge_rows(self, cursor):
+        with transaction.atomic():
+            cursor.execute(CREATE_STAGING_SQL)
+            rows = self.stage('copy', self.copy_rows, cursor)
+            self.metrics.advance(rows)
+            self.counts['locations_created'] = self.stage(
+                'locations', self.insert_locations, cursor)
+            (self.counts['properties_created'],
+             self.counts['properties_updated']) = self.stage(
+                'properties', self.execute, cursor, UPSERT_PROPERTIES_SQL)
+            (self.counts['links_added'],
+             self.counts['links_removed']) = self.stage(
+                'location_links', self.execute, cursor, LINK_LOCATIONS_SQL)
+            # Bulk SQL sends no signals, the summaries of the staged
+            # properties are rewritten with them
+            cursor.execute(STAGED_PROPERTIES_SQL)
+            self.stage('summaries', read_model.refresh,
+                       [pk for pk, in cursor.fetchall()])
+            cursor.execute(NEW_FILES_SQL)
+            paths = [source_path for source_path, in cursor.fetchall()]
+            self.counts['files_to_copy'] = len(paths)
+            if self.dry_run:
+                # Only checks that the files are there
+                stored = self.stage('files', self.copy_files, paths)
+                self.insert_images(cursor, stored)
+                transaction.set_rollback(True)
+                return
+
+        # Locations, properties and links are committed and no transaction
+        # is open while the files are copied. Should the run stop here,
+        # the images are missing, never broken, and the next run adds them
+        stored = self.stage('files', self.copy_files, paths)
+        with transaction.atomic():
+            self.insert_images(cursor, stored)
+
+    def insert_images(self, cursor, stored):
+        """Insert the rows of the new images whose file is in ``stored``,
+        then drop the staging tables, in the caller's transaction."""
+        execute_values(
+            cursor.cursor,
+            f"INSERT INTO {FILES_TABLE} (source_path, image, content_hash, "
+            f"has_renditions) VALUES %s", stored, page_size=1000)
+        self.counts['images_created'], property_ids = self.stage(
+            'images', self.execute, cursor, INSERT_IMAGES_SQL)
+        # Only properties that received images, the others keep their
+        # choice of featured image, or lack of one
+        self.counts['images_featured'] = self.stage(
+            'featured', bulk.feature_first_images, property_ids)
+        self.stage('summaries', read_model.refresh, property_ids)
+        cursor.execute(f"DROP TABLE {STAGING_TABLE}, {FILES_TABLE}")
+
+    def execute(self, cursor, sql):
+        cursor.execute(sql)
+        return cursor.fetchone()
+
+    def copy_rows(self, cursor):
+        """Stream COPY ... TO STDOUT from the Scrapy database straight into
+        COPY ... FROM STDIN on the Django one, through a pipe."""
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def produce():
+            try:
+                with os.fdopen(write_fd, 'wb') as pipe:
+                    self.scrapy_source.copy_to(SOURCE_QUERY, pipe)
+            except Exception as e:
+                errors.append(e)
+
+        producer = threading.Thread(target=produce, name='scrapy-copy')
+        producer.start()
+        try:
+            with os.fdopen(read_fd, 'rb') as pipe:
+                cursor.copy_expert(
+                    f"COPY {STAGING_TABLE} FROM STDIN", pipe)
+        finally:
+            # Closing the read end unblocks a producer stuck on a full pipe
+            producer.join()
+        if errors:
+            raise errors[0]
+        cursor.execute(f"ANALYZE {STAGING_TABLE}")
+        cursor.execute(f"SELECT count(*) FROM {STAGING_TABLE}")
+        return cursor.fetchone()[0]
+
+    def insert_locations(self, cursor):
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)",
+                       [LOCATION_LOCK_ID])
+        cursor.execute(INSERT_LOCATIONS_SQL)
+        # One row per new country or city, not per property
+        created = [
+            Location(id=pk, geohash=geo.encode(latitude, longitude))
+            for pk, latitude, longitude in cursor.fetchall()
+        ]
+        Location.objects.bulk_update(created, ['geohash'], batch_size=1000)
+        return len(created)
+
+    def copy_files(self, paths):
+        """Store the file of every new image path, in parallel. Returns
+        (source path, stored name, hash, has renditions) of each file
+        stored; paths whose file cannot be read are left out, so are their
+        images, as in the ORM path."""
+        with ThreadPoolExecutor(max_workers=self.image_workers,
+                                thread_name_prefix='image-copy') as executor:
+            stored = [file for file in executor.map(self.copy_file, paths)
+                      if file is not None]
+        self.counts['files_copied'] = len(stored)
+        return stored
+
+    def copy_file(self, source_path):
+        full_path = os.path.join(self.image_base_path,
+                                 *source_path.split('/'))
+        try:
+            if self.dry_run:
+                # Nothing is written, only check the file is there
+                os.stat(full_path)
+                return source_path, source_path, '', False
+            with open(full_path, 'rb') as img_file:
+                name, digest, _ = content_store.store(
+                    default_storage, File(img_file), source_path)
+        except OSError as e:
+            self.metrics.count('files_failed')
+            self.metrics.error('files', e, source_path=source_path)
+            self.stdout.write(self.style.WARNING(
+                f"Cannot copy {source_path}: {e}"))
+            return None
+        return (source_path, name, digest,
+                ensure_renditions(default_storage, name))
+
+    def report(self):
+        self.metrics.finish()
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING(
+                "Dry run, every change was rolled back"))
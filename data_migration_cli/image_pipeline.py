@@ -0,0 +1,125 @@
+from concurrent.futures import (
+    ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait)
+import os
+from pathlib import Path
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from admin_panel import bulk, content_store, read_model
+from admin_panel.models import PropertyImage
+from admin_panel.renditions import ensure_renditions
+from data_migration_cli.metrics import MigrationMetrics
+from data_migration_cli.models import MissingImage
+
+
+class ImagePipeline:
+    """Copies crawled images into storage on a bounded thread pool.
+
+    Worker threads only touch the filesystem; the PropertyImage rows are
+    collected on the calling thread and written with bulk_create, so the
+    stage never runs inside a property transaction. At most
+    ``queue_depth`` copies are in flight at any time, which keeps memory
+    bounded no matter how many images a crawl has.
+    """
+
+    def __init__(self, base_path, stdout, style, workers=4, queue_depth=64,
+                 batch_size=1000, metrics=None):
+        self.base_path = base_path
+        self.stdout = stdout
+        self.style = style
+        self.metrics = metrics or MigrationMetrics(stdout)
+        self.queue_depth = max(queue_depth, workers)
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='image-copy')
+        # Future -> (property id, image path)
+        self.pending = {}
+        self.images = []
+        # Files that do not exist, recorded so the rows are not imported
+        # again for their sake
+        self.missing = []
+        self.copied = 0
+        self.failed = 0
+
+    def submit(self, property_id, image_path):
+        while len(self.pending) >= self.queue_depth:
+            self.drain(FIRST_COMPLETED)
+        future = self.executor.submit(
+            self.copy_image, property_id, image_path)
+        self.pending[future] = (property_id, image_path)
+
+    def copy_image(self, property_id, image_path):
+        with self.metrics.timer('image_copy'):
+            return self.copy_file(property_id, image_path)
+
+    def copy_file(self, property_id, image_path):
+        path_parts = Path(image_path.strip()).parts
+        file_name = Path(image_path).name
+        full_path = os.path.join(self.base_path, *path_parts)
+
+        # The file is hashed and copied chunk by chunk instead of being
+        # read into memory, and not copied at all if it is stored already
+        with open(full_path, 'rb') as img_file:
+            saved_path, digest, _ = content_store.store(
+                default_storage, File(img_file), file_name)
+        return PropertyImage(
+            property_id=property_id,
+            image=saved_path,
+            caption=file_name,
+            has_renditions=ensure_renditions(default_storage, saved_path),
+            content_hash=digest,
+        )
+
+    def drain(self, return_when=ALL_COMPLETED):
+        if not self.pending:
+            return
+        done, _ = wait(self.pending, return_when=return_when)
+        for future in done:
+            property_id, image_path = self.pending.pop(future)
+            try:
+                self.images.append(future.result())
+                self.copied += 1
+                self.metrics.count('images_copied')
+            except Exception as e:
+                self.failed += 1
+                self.metrics.count('images_failed')
+                self.metrics.error('image_copy', e, property_id=property_id,
+                                   image_path=image_path)
+                if isinstance(e, FileNotFoundError):
+                    self.missing.append(MissingImage(
+                        property_id=property_id,
+                        caption=Path(image_path).name,
+                        image_path=image_path))
+                    self.stdout.write(self.style.WARNING(
+                        f"File not found: {e.filename}"))
+                else:
+                    self.stdout.write(self.style.ERROR(
+                        f"An error occurred: {e}"))
+
+        if len(self.images) + len(self.missing) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.missing:
+            MissingImage.objects.bulk_create(
+                self.missing, ignore_conflicts=True)
+            self.missing = []
+        if self.images:
+            with self.metrics.timer('image_write'), transaction.atomic():
+                PropertyImage.objects.bulk_create(self.images)
+                property_ids = {image.property_id for image in self.images}
+                # The first image of a property is featured unless it
+                # already has a featured image
+                bulk.feature_first_images(property_ids)
+                read_model.refresh(property_ids)
+            self.images = []
+
+    def close(self):
+        self.drain()
+        self.flush()
+        self.executor.shutdown()
+        self.stdout.write(
+            f"Images: {self.copied} copied, {self.failed} failed")
+
+    def abort(self):
+        self.executor.shutdown(cancel_futures=True)
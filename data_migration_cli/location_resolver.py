@@ -0,0 +1,86 @@
+from django.db import connection
+from django.db.models.functions import Lower
+from admin_panel import geo
+from admin_panel.models import Location
+
+# Key of the PostgreSQL advisory lock that serializes location inserts
+# between concurrent migration workers
+LOCATION_LOCK_ID = 727001
+
+
+class LocationResolver:
+    """In-memory cache of Location rows keyed by (lower(name), type).
+
+    Every existing location is loaded once when the run starts; names that
+    are not known yet are created with one bulk insert per batch, so
+    lookups never go back to the database afterwards.
+    """
+
+    def __init__(self):
+        self.locations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self.locations = {}
+        for location in Location.objects.order_by('id').only(
+                'id', 'name', 'type').iterator():
+            # Keep the oldest row when names only differ by case, the same
+            # one get_or_create(name__iexact=...) used to return
+            self.locations.setdefault(
+                (location.name.lower(), location.type), location)
+
+    def resolve(self, candidates):
+        """Create the unseen locations among ``candidates``.
+
+        ``candidates`` is an iterable of (name, type, latitude, longitude)
+        tuples. Returns the list of newly created locations.
+        """
+        missing = {}
+        for name, location_type, latitude, longitude in candidates:
+            key = (name.lower(), location_type)
+            if key in self.locations or key in missing:
+                self.hits += 1
+                continue
+            self.misses += 1
+            missing[key] = Location(
+                name=name,
+                type=location_type,
+                latitude=latitude,
+                longitude=longitude,
+                # bulk_create skips Location.save(), which sets it
+                geohash=geo.encode(latitude, longitude),
+            )
+
+        if missing and connection.vendor == 'postgresql':
+            self.lock_and_reload(missing)
+        if not missing:
+            return []
+        created = Location.objects.bulk_create(missing.values())
+        self.locations.update(zip(missing, created))
+        return created
+
+    def lock_and_reload(self, missing):
+        # Held until the surrounding transaction ends, so another worker
+        # that created the same names has committed them by the time the
+        # lock is granted
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)",
+                           [LOCATION_LOCK_ID])
+        names = {name for name, location_type in missing}
+        for location in Location.objects.annotate(
+                lower_name=Lower('name')).filter(
+                lower_name__in=names).order_by('id'):
+            key = (location.lower_name, location.type)
+            if key in missing:
+                del missing[key]
+                self.locations[key] = location
+                self.misses -= 1
+                self.hits += 1
+
+    def get(self, name, location_type):
+        return self.locations[(name.lower(), location_type)]
+
+    def stats(self):
+        return (f"Location lookups: {self.hits} hits, "
+                f"{self.misses} misses ({len(self.locations)} cached)")
@@ -0,0 +1,220 @@
+from datetime import datetime, timezone
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import (
+    BaseCommand, CommandError, OutputWrapper)
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases,
+    setup_test_environment, teardown_databases, teardown_test_environment)
+from django.urls import reverse
+from admin_panel.models import Location, Property
+from data_migration_cli.management.commands.migrate_scrapy_data import (
+    DataMigrator)
+from data_migration_cli.sources import SqliteSource
+from data_migration_cli.synthetic import attach_amenities, generate_catalogue
+
+# Bump when the layout of the results file changes
+RESULTS_VERSION = 1
+
+
+class Command(BaseCommand):
+    help = ('Benchmark migrate_scrapy_data, the admin and the API on a '
+            'synthetic catalogue in a throwaway test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--properties', type=int, default=1000,
+                            help='Number of synthetic Scrapy rows')
+        parser.add_argument('--locations', type=int, default=100,
+                            help='Number of distinct countries and cities')
+        parser.add_argument('--amenities', type=int, default=50,
+                            help='Number of amenities')
+        parser.add_argument('--amenities-per-property', type=int,
+                            default=5)
+        parser.add_argument('--images-per-property', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Batch size passed to the migrator')
+        parser.add_argument('--image-workers', type=int, default=4,
+                            help='Image threads passed to the migrator')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs of every request')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--label', default='',
+                            help='Free text stored with the results')
+        parser.add_argument('--output', default='benchmark_results.json',
+                            help='Where the JSON results are written')
+
+    def handle(self, *args, **options):
+        results = {
+            'version': RESULTS_VERSION,
+            'label': options['label'],
+            'commit': git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'parameters': {
+                key: options[key] for key in (
+                    'properties', 'locations', 'amenities',
+                    'amenities_per_property', 'images_per_property',
+                    'batch_size', 'image_workers', 'repeat', 'seed')
+            },
+        }
+
+        with tempfile.TemporaryDirectory(prefix='benchmark-') as directory:
+            self.stdout.write("Generating synthetic catalogue...")
+            db_path, crawl_path = generate_catalogue(
+                directory, options['properties'], options['locations'],
+                options['images_per_property'], options['seed'])
+
+            # Media files go to a throwaway location too, so the real ones
+            # are never touched
+            media_root = os.path.join(directory, 'media')
+            with override_settings(MEDIA_ROOT=media_root):
+                setup_test_environment()
+                old_config = setup_databases(
+                    verbosity=0, interactive=False, aliases={'default'})
+                try:
+                    results['migration'] = self.bench_migration(
+                        db_path, crawl_path, options)
+                    attach_amenities(options['amenities'],
+                                     options['amenities_per_property'],
+                                     options['seed'])
+                    results['requests'] = self.bench_requests(
+                        options['repeat'])
+                finally:
+                    teardown_databases(old_config, verbosity=0)
+                    teardown_test_environment()
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Results written to {options['output']}"))
+
+    def bench_migration(self, db_path, crawl_path, options):
+        runs = {}
+        # The second run finds every row unchanged, which times the
+        # incremental fast path
+        for name in ('full', 'incremental_unchanged'):
+            migrator = DataMigrator(
+                OutputWrapper(io.StringIO()), no_style(), dry_run=False,
+                batch_size=options['batch_size'],
+                image_workers=options['image_workers'],
+                incremental=True, source='benchmark',
+                scrapy_source=SqliteSource(db_path),
+                image_base_path=crawl_path)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                migrator.migrate()
+                seconds = time.perf_counter() - start
+            if migrator.error:
+                raise CommandError(f"Migration failed: {migrator.error}")
+            rows = migrator.migrated + migrator.skipped
+            runs[name] = {
+                'seconds': round(seconds, 3),
+                'rows': rows,
+                'rows_per_second': round(rows / seconds, 1),
+                'migrated': migrator.migrated,
+                'skipped': migrator.skipped,
+                'images_copied': migrator.image_pipeline.copied,
+                'images_failed': migrator.image_pipeline.failed,
+                'queries': len(queries),
+                'stages': migrator.metrics.summary()['stages'],
+            }
+            self.stdout.write(
+                f"migrate ({name}): {rows} rows in {seconds:.2f}s, "
+                f"{len(queries)} queries")
+        return runs
+
+    def bench_requests(self, repeat):
+        client = Client()
+        client.force_login(get_user_model().objects.create_superuser(
+            'benchmark', 'benchmark@example.com', None))
+        results = []
+        for name, url in benchmark_urls():
+            result = time_request(client, url, repeat)
+            result['name'] = name
+            results.append(result)
+            self.stdout.write(
+                f"{name}: {result['median_ms']}ms median, "
+                f"{result['queries']} queries, {result['bytes']} bytes")
+        return results
+
+
+def benchmark_urls():
+    """(name, url) of every admin changelist and change form and of the
+    API endpoints."""
+    urls = []
+    for model, model_admin in admin.site._registry.items():
+        opts = model._meta
+        prefix = f'admin:{opts.app_label}_{opts.model_name}'
+        urls.append((f'{prefix}_changelist', reverse(f'{prefix}_changelist')))
+        obj = model._default_manager.order_by('pk').first()
+        if obj is not None:
+            urls.append((f'{prefix}_change',
+                         reverse(f'{prefix}_change', args=[obj.pk])))
+
+    urls.append(('api-property-list', reverse('api-property-list')))
+    urls.append(('api-property-summaries',
+                 reverse('api-property-summaries')))
+    location = Location.objects.filter(type='city').order_by('pk').first()
+    if location is not None:
+        urls.append(('api-properties-near',
+                     f"{reverse('api-properties-near')}"
+                     f"?lat={location.latitude}&lon={location.longitude}"))
+    obj = Property.objects.order_by('pk').first()
+    if obj is not None:
+        word = obj.title.split()[0]
+        urls.append(('api-property-search',
+                     f"{reverse('api-property-search')}?q={word}"))
+        urls.append(('api-property-detail',
+                     reverse('api-property-detail', args=[obj.pk])))
+    return urls
+
+
+def time_request(client, url, repeat):
+    # The first, untimed request fills caches; it is reported separately
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = client.get(url)
+        cold_ms = (time.perf_counter() - start) * 1000
+    cold_queries = len(queries)
+
+    timings = []
+    for _ in range(max(1, repeat)):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'url': url,
+        'status': response.status_code,
+        'bytes': len(response.content),
+        'queries': len(queries),
+        'cold_queries': cold_queries,
+        'cold_ms': round(cold_ms, 2),
+        'min_ms': round(min(timings), 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'max_ms': round(max(timings), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
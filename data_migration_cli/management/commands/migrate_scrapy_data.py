@@ -1,14 +1,22 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-import psycopg2
-from admin_panel.models import Property, Location, PropertyImage
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+import hashlib
 from pathlib import Path
+from admin_panel import read_model
+from admin_panel.models import Property, PropertyImage
 from django.contrib.auth import authenticate
 import getpass
+import traceback
 from config import SCRAPY_DATABASE_CONFIG, WEB_CRAWLER_BASE_PATH
+from data_migration_cli.copy_engine import CopyImporter
+from data_migration_cli.image_pipeline import ImagePipeline
+from data_migration_cli.location_resolver import LocationResolver
+from data_migration_cli.metrics import MigrationMetrics
+from data_migration_cli.models import (
+    MigrationCheckpoint, MissingImage, SourceRecord)
+from data_migration_cli.sharding import SHARD_SIZE, ShardCoordinator
+from data_migration_cli.sources import PostgresSource
 
 
 class Command(BaseCommand):
@@ -17,8 +25,52 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true',
                             help='Perform a dry run without making changes')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of source rows streamed and '
+                                 'committed per transaction')
+        parser.add_argument('--fetch-size', type=int,
+                            help='Rows fetched from the Scrapy database per '
+                                 'round trip (default: the batch size)')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='Times a dropped Scrapy database '
+                                 'connection is reopened before giving up')
+        parser.add_argument('--image-workers', type=int, default=4,
+                            help='Number of threads copying image files')
+        parser.add_argument('--image-queue', type=int, default=64,
+                            help='Maximum number of image copies in flight')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Skip unchanged rows, update changed ones '
+                                 'and resume an interrupted run')
+        parser.add_argument('--source',
+                            default=f"{SCRAPY_DATABASE_CONFIG['NAME']}"
+                                    ".properties",
+                            help='Name the checkpoint is recorded under')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of processes migrating id-range '
+                                 'shards in parallel')
+        parser.add_argument('--shard-size', type=int, default=SHARD_SIZE,
+                            help='Source ids per shard with --workers')
+        parser.add_argument('--engine', choices=['orm', 'copy'],
+                            default='orm',
+                            help="'copy' loads the rows with COPY into a "
+                                 "staging table and merges them in SQL "
+                                 "(PostgreSQL only)")
+        parser.add_argument('--report',
+                            help='Write a JSON lines run report, with one '
+                                 'record per failed row or image, to this '
+                                 'file')
 
     def handle(self, *args, **options):
+        if options['engine'] == 'copy':
+            if connection.vendor != 'postgresql':
+                raise CommandError(
+                    "--engine copy needs a PostgreSQL Django database")
+            if options['incremental'] or options['workers'] > 1:
+                raise CommandError("--engine copy does not support "
+                                   "--incremental or --workers")
+        if options['shard_size'] < 1:
+            raise CommandError("--shard-size must be at least 1")
+
         # Prompt for admin credentials
         username = input("Enter admin username: ")
         password = getpass.getpass("Enter admin password: ")
@@ -35,122 +87,383 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('Performing dry run...'))
         else:
             self.stdout.write(self.style.SUCCESS('Starting migration...'))
-        migrator = DataMigrator(self.stdout, self.style, dry_run)
-        migrator.migrate()
+        migrator_options = {
+            'dry_run': dry_run,
+            'batch_size': options['batch_size'],
+            'fetch_size': options['fetch_size'],
+            'retries': options['retries'],
+            'image_workers': options['image_workers'],
+            'image_queue': options['image_queue'],
+            'incremental': options['incremental'],
+            'source': options['source'],
+        }
+        if options['engine'] == 'copy':
+            importer = CopyImporter(
+                self.stdout, self.style,
+                PostgresSource(retries=options['retries']),
+                WEB_CRAWLER_BASE_PATH, dry_run=dry_run,
+                image_workers=options['image_workers'],
+                report_path=options['report'])
+            importer.run()
+        elif options['workers'] > 1:
+            coordinator = ShardCoordinator(
+                self.stdout, self.style, options['workers'],
+                migrator_options, report_path=options['report'],
+                shard_size=options['shard_size'])
+            coordinator.run()
+        else:
+            migrator = DataMigrator(self.stdout, self.style,
+                                    report_path=options['report'],
+                                    **migrator_options)
+            migrator.migrate()
 
 
 class DataMigrator:
-    def __init__(self, stdout, style, dry_run):
+    def __init__(self, stdout, style, dry_run, batch_size=1000,
+                 fetch_size=None, retries=3,
+                 image_workers=4, image_queue=64, incremental=False,
+                 source='properties', id_range=None, scrapy_source=None,
+                 image_base_path=WEB_CRAWLER_BASE_PATH, report_path=None):
         self.stdout = stdout
         self.style = style
         self.dry_run = dry_run
-        self.scrapy_conn = psycopg2.connect(
-            dbname=SCRAPY_DATABASE_CONFIG['NAME'],
-            user=SCRAPY_DATABASE_CONFIG['USER'],
-            password=SCRAPY_DATABASE_CONFIG['PASSWORD'],
-            host=SCRAPY_DATABASE_CONFIG['HOST'],
-            port=SCRAPY_DATABASE_CONFIG['PORT']
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.source = source
+        # Shards only read the (first_id, last_id) range they were given
+        # and keep a checkpoint of their own
+        self.id_range = id_range
+        self.checkpoint_name = source
+        if id_range:
+            self.checkpoint_name = f"{source}[{id_range[0]}-{id_range[1]}]"
+        self.checkpoint = None
+        self.migrated = 0
+        self.skipped = 0
+        self.error = None
+        self.metrics = MigrationMetrics(stdout, report_path)
+        self.location_resolver = LocationResolver()
+        self.image_pipeline = ImagePipeline(
+            image_base_path, stdout, style,
+            workers=image_workers,
+            queue_depth=image_queue,
+            batch_size=batch_size,
+            metrics=self.metrics,
         )
-        self.scrapy_cursor = self.scrapy_conn.cursor()
+        # Connections come from a pool shared by every source in this
+        # process, so repeated runs skip the connection setup
+        self.scrapy_source = scrapy_source or PostgresSource(
+            fetch_size=fetch_size or batch_size, retries=retries)
 
     def migrate(self):
         try:
-            self.scrapy_cursor.execute("SELECT * FROM properties")
-            properties = self.scrapy_cursor.fetchall()
+            after_id = self.id_range[0] - 1 if self.id_range else 0
+            if not self.dry_run:
+                self.location_resolver.load()
+                if self.incremental:
+                    after_id = self.start_checkpoint(after_id)
+            last_id = self.id_range[1] if self.id_range else None
+            self.metrics.start(
+                self.scrapy_source.count(after_id, last_id),
+                source=self.checkpoint_name, after_id=after_id,
+                last_id=last_id, dry_run=self.dry_run)
+            for rows in self.metrics.timed(
+                    'fetch', self.scrapy_source.fetch_batches(
+                        self.batch_size, after_id, last_id)):
+                count, image_jobs = self.migrate_rows(rows)
+                self.migrated += count
+
+                # Images are copied after the batch is committed so slow
+                # file I/O never holds a transaction open
+                for property_id, image_path in image_jobs:
+                    self.image_pipeline.submit(property_id, image_path)
+                self.metrics.advance(len(rows))
 
-            for property_data in properties:
-                with transaction.atomic():
-                    self.migrate_property(property_data)
+            self.image_pipeline.close()
+            if self.checkpoint:
+                self.checkpoint.completed = True
+                self.checkpoint.save()
 
             self.stdout.write(self.style.SUCCESS(
-                "Successfully migrated all properties"))
+                f"Successfully migrated {self.migrated} properties"))
+            if self.incremental:
+                self.stdout.write(f"Skipped {self.skipped} unchanged rows")
+            if not self.dry_run:
+                self.stdout.write(self.location_resolver.stats())
 
         except Exception as e:
+            self.error = str(e)
+            self.metrics.error('run', e, traceback=traceback.format_exc())
             self.stdout.write(self.style.ERROR(f"An error occurred: {str(e)}"))
+            self.save_pending_images()
 
         finally:
-            self.scrapy_cursor.close()
-            self.scrapy_conn.close()
+            self.image_pipeline.abort()
+            self.scrapy_source.close()
+            self.metrics.finish()
+
+    def save_pending_images(self):
+        # The batches already committed, fingerprints and checkpoint
+        # included, so their images have to be written too or a resumed
+        # run would skip those rows as unchanged
+        try:
+            self.image_pipeline.close()
+        except Exception as e:
+            self.metrics.error('image_write', e)
+            self.stdout.write(self.style.ERROR(
+                f"Could not write the pending images: {e}"))
+
+    def start_checkpoint(self, after_id):
+        self.checkpoint, created = MigrationCheckpoint.objects.get_or_create(
+            source=self.checkpoint_name)
+        if created or self.checkpoint.completed:
+            # The previous run finished, so scan the whole table again
+            self.checkpoint.last_source_id = after_id
+            self.checkpoint.completed = False
+            self.checkpoint.save()
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Resuming after source id "
+                f"{self.checkpoint.last_source_id}"))
+        return self.checkpoint.last_source_id
 
-    def migrate_property(self, property_data):
-        (id, h3_tag, country_name, city_name, title,
-         star, rating, location, latitude, longitude,
-         room_type, price, image_paths) = property_data
+    def migrate_rows(self, rows):
+        """Migrate ``rows`` in one transaction. If that fails, every row
+        gets a savepoint of its own so only the bad ones are left out,
+        each recorded as an error."""
+        try:
+            with self.metrics.timer('write'), transaction.atomic():
+                return self.migrate_batch(rows)
+        except Exception as e:
+            if len(rows) == 1:
+                self.row_failed(rows[0], e)
+                return 0, []
+            self.stdout.write(self.style.WARNING(
+                f"Batch up to source id {rows[-1][0]} failed ({e}), "
+                f"retrying row by row"))
+
+        # Locations created by the rolled back batch are gone
+        self.location_resolver.load()
+        migrated = 0
+        image_jobs = []
+        with transaction.atomic():
+            for property_data in rows:
+                try:
+                    with self.metrics.timer('write'), transaction.atomic():
+                        count, jobs = self.migrate_batch([property_data])
+                except Exception as e:
+                    self.row_failed(property_data, e)
+                    continue
+                migrated += count
+                image_jobs += jobs
+            if self.checkpoint:
+                # Failed rows are in the report, do not retry them on resume
+                self.checkpoint.last_source_id = rows[-1][0]
+                self.checkpoint.save()
+        return migrated, image_jobs
 
+    def row_failed(self, property_data, error):
+        self.metrics.count('rows_failed')
+        self.metrics.error('write', error, source_id=property_data[0],
+                           title=property_data[4])
+        self.stdout.write(self.style.ERROR(
+            f"Source id {property_data[0]} failed: {error}"))
+
+    def migrate_batch(self, rows):
         if self.dry_run:
-            self.stdout.write(f"Would migrate property: {id}")
-            return
+            self.count_on_commit('would_migrate', len(rows))
+            return 0, []
 
-        property_instance = Property.objects.create(
-            property_id=str(id),
-            title=title or '',
-            description=''
-        )
+        fingerprints = {
+            property_data[0]: fingerprint(property_data)
+            for property_data in rows
+        }
+        existing = self.find_existing(rows)
 
-        if country_name:
-            country_location, created = Location.objects.get_or_create(
-                name__iexact=country_name,
-                type='country',
-                defaults={
-                    'name': country_name,
-                    'latitude': latitude,
-                    'longitude': longitude
-                }
-            )
-            property_instance.locations.add(country_location)
-            if created:
-                self.stdout.write(self.style.SUCCESS(
-                    f"Created new country location: {country_name}"))
+        new_rows = []
+        changed = []
+        unchanged = []
+        for property_data in rows:
+            match = existing.get(property_data[0])
+            if match is None:
+                new_rows.append(property_data)
+            elif match[1] != fingerprints[property_data[0]]:
+                changed.append((match[0], property_data))
             else:
-                self.stdout.write(self.style.SUCCESS(
-                    f"Using existing country location: {country_name}"))
-
-        if city_name:
-            city_location, created = Location.objects.get_or_create(
-                name__iexact=city_name,
-                type='city',
-                defaults={
-                    'name': city_name,
-                    'latitude': latitude,
-                    'longitude': longitude
-                }
+                unchanged.append((match[0], property_data))
+        incomplete = self.missing_images(unchanged)
+        changed += incomplete
+        skipped = len(unchanged) - len(incomplete)
+
+        imported = list(zip(Property.objects.bulk_create([
+            Property(property_id=str(property_data[0]),
+                     title=property_data[4] or '',
+                     description='')
+            for property_data in new_rows
+        ]), new_rows))
+        imported += self.update_changed(changed)
+        transaction.on_commit(lambda: self.count_skipped(skipped))
+        self.count_on_commit('created', len(new_rows))
+        self.count_on_commit('updated', len(changed))
+
+        image_jobs = []
+        if imported:
+            image_jobs = self.write_relations(imported, changed)
+            # Bulk writes send no signals, the summaries are rewritten
+            # here and again when the images are stored
+            read_model.refresh(
+                property_instance.id for property_instance, _ in imported)
+
+        if self.incremental:
+            SourceRecord.objects.bulk_create(
+                [SourceRecord(source=self.source,
+                              source_id=property_data[0],
+                              fingerprint=fingerprints[property_data[0]],
+                              property_id=property_instance.id)
+                 for property_instance, property_data in imported],
+                update_conflicts=True,
+                unique_fields=['source', 'source_id'],
+                update_fields=['fingerprint', 'property'],
             )
-            property_instance.locations.add(city_location)
-            if created:
-                self.stdout.write(self.style.SUCCESS(
-                    f"Created new city location: {city_name}"))
-            else:
-                self.stdout.write(self.style.SUCCESS(
-                    f"Using existing city location: {city_name}"))
+            # Saved in the batch transaction, so a crash resumes right
+            # after the last committed batch
+            self.checkpoint.last_source_id = rows[-1][0]
+            self.checkpoint.save()
+        return len(imported), image_jobs
 
-        if image_paths:
-            for image_path in image_paths.split(','):
-                path_parts = Path(image_path.strip()).parts
-                file_name = Path(image_path).name
+    def count_skipped(self, skipped):
+        self.skipped += skipped
+        self.metrics.count('skipped', skipped)
 
-                full_path = os.path.join(
-                    WEB_CRAWLER_BASE_PATH,
-                    # 'user-base-directory/web_crawler/dynamic_crawling/',
-                    *path_parts
-                )
+    def count_on_commit(self, name, value):
+        # Rows of a batch that is rolled back and retried are not counted
+        transaction.on_commit(lambda: self.metrics.count(name, value))
+
+    def find_existing(self, rows):
+        source_ids = [property_data[0] for property_data in rows]
+        existing = {}
+        if self.incremental:
+            existing = {
+                source_id: (property_id, row_fingerprint)
+                for source_id, property_id, row_fingerprint in
+                SourceRecord.objects.filter(
+                    source=self.source, source_id__in=source_ids
+                ).values_list('source_id', 'property_id', 'fingerprint')
+            }
+
+        # Properties without a fingerprint (full runs, or imported before
+        # incremental mode) are matched on property_id and always updated
+        unknown = [i for i in source_ids if i not in existing]
+        if unknown:
+            for property_id, pk in Property.objects.filter(
+                    property_id__in=unknown).values_list('property_id', 'id'):
+                existing[property_id] = (pk, None)
+        return existing
+
+    def missing_images(self, matches):
+        """The (pk, row) pairs of ``matches`` whose property lacks some of
+        the row's images, such as images lost to an interrupted run. They
+        are imported again like changed rows, which only adds the images
+        they do not have. Images whose file was not found do not count."""
+        expected = {
+            pk: {Path(image_path).name
+                 for image_path in property_data[12].split(',')}
+            for pk, property_data in matches if property_data[12]
+        }
+        if not expected:
+            return []
+        found = {}
+        for pk, caption in PropertyImage.objects.filter(
+                property_id__in=expected).values_list(
+                'property_id', 'caption'):
+            found.setdefault(pk, set()).add(caption)
+        for pk, caption in MissingImage.objects.filter(
+                property_id__in=expected).values_list(
+                'property_id', 'caption'):
+            found.setdefault(pk, set()).add(caption)
+        return [
+            (pk, property_data) for pk, property_data in matches
+            if expected.get(pk, set()) - found.get(pk, set())
+        ]
+
+    def update_changed(self, changed):
+        if not changed:
+            return []
+        instances = Property.objects.in_bulk(
+            [pk for pk, property_data in changed])
+        # bulk_update skips Property.save, which sets update_date
+        now = timezone.now()
+        updated = []
+        for pk, property_data in changed:
+            property_instance = instances[pk]
+            property_instance.title = property_data[4] or ''
+            property_instance.update_date = now
+            updated.append((property_instance, property_data))
+        Property.objects.bulk_update(
+            [property_instance for property_instance, _ in updated],
+            ['title', 'update_date'])
+        return updated
+
+    def write_relations(self, imported, changed):
+        self.resolve_locations(
+            [property_data for _, property_data in imported])
+
+        # Changed properties get their locations rebuilt and only receive
+        # images they do not have yet
+        changed_ids = [pk for pk, _ in changed]
+        known_images = set()
+        if changed_ids:
+            Property.locations.through.objects.filter(
+                property_id__in=changed_ids).delete()
+            known_images = set(PropertyImage.objects.filter(
+                property_id__in=changed_ids).values_list(
+                'property_id', 'caption'))
+
+        property_locations = []
+        image_jobs = []
+        for property_instance, property_data in imported:
+            (id, h3_tag, country_name, city_name, title,
+             star, rating, location, latitude, longitude,
+             room_type, price, image_paths) = property_data
+
+            for name, location_type in ((country_name, 'country'),
+                                        (city_name, 'city')):
+                if not name:
+                    continue
+                location_instance = self.location_resolver.get(
+                    name, location_type)
+                property_locations.append(Property.locations.through(
+                    property_id=property_instance.id,
+                    location_id=location_instance.id,
+                ))
+
+            if image_paths:
+                image_jobs.extend(
+                    (property_instance.id, image_path)
+                    for image_path in image_paths.split(',')
+                    if (property_instance.id, Path(image_path).name)
+                    not in known_images)
+
+        Property.locations.through.objects.bulk_create(
+            property_locations, ignore_conflicts=True)
+        return image_jobs
+
+    def resolve_locations(self, rows):
+        candidates = []
+        for property_data in rows:
+            country_name, city_name = property_data[2], property_data[3]
+            latitude, longitude = property_data[8], property_data[9]
+            if country_name:
+                candidates.append(
+                    (country_name, 'country', latitude, longitude))
+            if city_name:
+                candidates.append((city_name, 'city', latitude, longitude))
+
+        with self.metrics.timer('locations'):
+            created = self.location_resolver.resolve(candidates)
+        self.count_on_commit('locations_created', len(created))
 
-                try:
-                    with open(full_path, 'rb') as img_file:
-                        django_file = ContentFile(img_file.read())
-                        saved_path = default_storage.save(
-                            f'property_images/{file_name}', django_file)
-                        PropertyImage.objects.create(
-                            property=property_instance,
-                            image=saved_path,
-                            caption=file_name,
-                            is_featured=True,
-                        )
-                except FileNotFoundError:
-                    self.stdout.write(self.style.WARNING(
-                        f"File not found: {full_path}"))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(
-                        f"An error occurred: {e}"))
 
-        self.stdout.write(self.style.SUCCESS(
-            f"Migrated property: {property_instance.property_id}"))
+def fingerprint(property_data):
+    return hashlib.sha1(
+        '\x1f'.join(str(value) for value in property_data).encode()
+    ).hexdigest()
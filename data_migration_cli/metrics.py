@@ -0,0 +1,179 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import threading
+import time
+
+# Seconds between two progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+class MigrationMetrics:
+    """Counters and stage timers of one migration run.
+
+    Stage times are exclusive, time spent in a stage nested inside another
+    one only counts for the inner stage. Stages timed on worker threads
+    (image copies) add up the time of every thread, so they can be longer
+    than the run itself.
+
+    ``advance`` prints a progress line with the throughput and an ETA at
+    most every ``interval`` seconds. When ``report_path`` is set, the
+    start of the run, every error and the final summary are written to it
+    as JSON lines.
+    """
+
+    def __init__(self, stdout, report_path=None, interval=PROGRESS_INTERVAL):
+        self.stdout = stdout
+        self.interval = interval
+        self.counters = defaultdict(int)
+        self.stages = defaultdict(lambda: {'seconds': 0.0, 'calls': 0})
+        self.errors = []
+        self.total = None
+        self.done = 0
+        self.started = self.last_progress = time.monotonic()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.report = open(report_path, 'w') if report_path else None
+
+    def start(self, total=None, **details):
+        self.total = total
+        self.write({'event': 'start', 'total': total, **details})
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def timer(self, stage):
+        stack = self.local.__dict__.setdefault('stack', [])
+        # [start, time spent in nested stages]
+        frame = [time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if stack:
+                stack[-1][1] += elapsed
+            with self.lock:
+                self.stages[stage]['seconds'] += elapsed - frame[1]
+                self.stages[stage]['calls'] += 1
+
+    def timed(self, stage, iterable):
+        """Yield from ``iterable``, timing every step under ``stage``."""
+        end = object()
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.timer(stage):
+                    item = next(iterator, end)
+                if item is end:
+                    return
+                yield item
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    def advance(self, rows):
+        self.done += rows
+        now = time.monotonic()
+        if now - self.last_progress >= self.interval:
+            self.last_progress = now
+            self.stdout.write(self.progress())
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        line = f"{self.done} rows"
+        if self.total:
+            line = (f"{self.done}/{self.total} rows "
+                    f"({min(self.done / self.total, 1):.0%})")
+        line += f", {rate:.0f} rows/s"
+        if self.total and rate:
+            remaining = max(self.total - self.done, 0) / rate
+            line += f", ETA {format_duration(remaining)}"
+        if self.errors:
+            line += f", {len(self.errors)} errors"
+        return line
+
+    def error(self, stage, error, **details):
+        """Record a failure that did not stop the run."""
+        record = {
+            'event': 'error',
+            'stage': stage,
+            'type': type(error).__name__,
+            'error': str(error).strip(),
+            **details,
+        }
+        with self.lock:
+            self.errors.append(record)
+        self.write(record)
+
+    def merge(self, summary, errors):
+        """Add the summary and errors of another run, such as a shard."""
+        self.done += summary['rows']
+        with self.lock:
+            for name, value in summary['counters'].items():
+                self.counters[name] += value
+            for stage, timing in summary['stages'].items():
+                self.stages[stage]['seconds'] += timing['seconds']
+                self.stages[stage]['calls'] += timing['calls']
+        for record in errors:
+            with self.lock:
+                self.errors.append(record)
+            self.write(record)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'rows': self.done,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.done / elapsed, 1)
+            if elapsed else 0.0,
+            'counters': dict(self.counters),
+            'stages': {
+                stage: {'seconds': round(timing['seconds'], 3),
+                        'calls': timing['calls']}
+                for stage, timing in self.stages.items()
+            },
+            'errors': len(self.errors),
+        }
+
+    def finish(self):
+        """Print the stage timings and counters, and close the report."""
+        summary = self.summary()
+        self.write({'event': 'summary', **summary})
+        if self.report:
+            self.report.close()
+            self.report = None
+
+        self.stdout.write(
+            f"{summary['rows']} rows in "
+            f"{format_duration(summary['seconds'])} "
+            f"({summary['rows_per_second']} rows/s), "
+            f"{summary['errors']} errors")
+        for stage, timing in summary['stages'].items():
+            self.stdout.write(
+                f"  {stage:<16} {timing['seconds']:10.2f}s "
+                f"{timing['calls']:>8} calls")
+        if summary['counters']:
+            self.stdout.write('  ' + ', '.join(
+                f"{name.replace('_', ' ')}: {value}"
+                for name, value in summary['counters'].items()))
+        return summary
+
+    def write(self, record):
+        if self.report is None:
+            return
+        record = {'time': datetime.now(timezone.utc).isoformat(), **record}
+        with self.lock:
+            self.report.write(json.dumps(record, default=str) + '\n')
+            self.report.flush()
@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 20:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('admin_panel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True,
+                 primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=200, unique=True)),
+                ('last_source_id', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('create_date', models.DateTimeField(auto_now_add=True)),
+                ('update_date', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SourceRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True,
+                 primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=200)),
+                ('source_id', models.BigIntegerField()),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                 related_name='source_records', to='admin_panel.property')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(
+                    fields=('source', 'source_id'),
+                    name='unique_source_record')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 21:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0010_property_summary_cache_table'),
+        ('data_migration_cli', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MissingImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True,
+                 primary_key=True, serialize=False, verbose_name='ID')),
+                ('caption', models.CharField(max_length=255)),
+                ('image_path', models.CharField(max_length=500)),
+                ('create_date', models.DateTimeField(auto_now_add=True)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                 related_name='missing_images', to='admin_panel.property')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(
+                    fields=('property', 'caption'),
+                    name='unique_missing_image')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import models
+from django.utils import timezone
+from admin_panel.models import Property
+
+
+class MigrationCheckpoint(models.Model):
+    source = models.CharField(max_length=200, unique=True)
+    last_source_id = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    create_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.source} (last id {self.last_source_id})"
+
+    def save(self, *args, **kwargs):
+        if self.id:  # If the object already exists
+            self.update_date = timezone.now()
+        super().save(*args, **kwargs)
+
+
+class SourceRecord(models.Model):
+    source = models.CharField(max_length=200)
+    source_id = models.BigIntegerField()
+    fingerprint = models.CharField(max_length=40)
+    property = models.ForeignKey(
+        Property, related_name='source_records', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'source_id'],
+                                    name='unique_source_record'),
+        ]
+
+
+class MissingImage(models.Model):
+    """An image of a source row whose file was not found. It is not
+    looked for again when checking that a row was fully imported."""
+    property = models.ForeignKey(
+        Property, related_name='missing_images', on_delete=models.CASCADE)
+    caption = models.CharField(max_length=255)
+    image_path = models.CharField(max_length=500)
+    create_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'caption'],
+                                    name='unique_missing_image'),
+        ]
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import io
+import django
+from django.core.management.base import OutputWrapper
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from data_migration_cli.location_resolver import LocationResolver
+from data_migration_cli.metrics import MigrationMetrics
+from data_migration_cli.sources import PostgresSource, close_pools
+
+# Source ids per shard
+SHARD_SIZE = 10000
+
+
+def plan_shards(first_id, last_id, size=SHARD_SIZE):
+    """Id ranges of ``size`` ids aligned on multiples of ``size``.
+
+    A shard's range, and so the name of its checkpoint, does not depend on
+    the current min(id) and max(id): new rows only add shards at the end,
+    and an interrupted incremental run resumes every shard it left.
+    """
+    return [(index * size, (index + 1) * size - 1)
+            for index in range(first_id // size, last_id // size + 1)]
+
+
+def migrate_shard(id_range, options):
+    # Imported here, the command module imports this one
+    from data_migration_cli.management.commands.migrate_scrapy_data import (
+        DataMigrator)
+
+    stdout = OutputWrapper(io.StringIO())
+    migrator = DataMigrator(stdout, no_style(), id_range=id_range, **options)
+    migrator.migrate()
+    return {
+        'id_range': id_range,
+        'migrated': migrator.migrated,
+        'skipped': migrator.skipped,
+        'images_copied': migrator.image_pipeline.copied,
+        'images_failed': migrator.image_pipeline.failed,
+        'error': migrator.error,
+        'metrics': migrator.metrics.summary(),
+        'errors': migrator.metrics.errors,
+    }
+
+
+class ShardCoordinator:
+    """Splits the Scrapy table into id ranges and migrates them in a
+    process pool, each worker with its own source and target connections.
+    """
+
+    def __init__(self, stdout, style, workers, options, report_path=None,
+                 shard_size=SHARD_SIZE):
+        self.stdout = stdout
+        self.style = style
+        self.workers = workers
+        self.shard_size = shard_size
+        self.options = options
+        self.metrics = MigrationMetrics(stdout, report_path)
+
+    def run(self):
+        scrapy_source = PostgresSource(retries=self.options['retries'])
+        first_id, last_id = scrapy_source.id_bounds()
+        if first_id is None:
+            self.stdout.write(self.style.WARNING("Nothing to migrate"))
+            return
+        if not self.options['dry_run']:
+            self.prepare_locations(scrapy_source)
+
+        shards = plan_shards(first_id, last_id, self.shard_size)
+        self.metrics.start(scrapy_source.count(), workers=self.workers,
+                           shards=len(shards),
+                           dry_run=self.options['dry_run'])
+        self.stdout.write(
+            f"Migrating ids {first_id}-{last_id} in {len(shards)} shards "
+            f"on {self.workers} workers")
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        close_pools()
+        totals = dict.fromkeys(
+            ('migrated', 'skipped', 'images_copied', 'images_failed'), 0)
+        failed = []
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=django.setup) as executor:
+            futures = [executor.submit(migrate_shard, shard, self.options)
+                       for shard in shards]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                for key in totals:
+                    totals[key] += result[key]
+                self.metrics.merge(result['metrics'], result['errors'])
+                first, last = result['id_range']
+                if result['error']:
+                    failed.append(result)
+                    self.stdout.write(self.style.ERROR(
+                        f"[{done}/{len(shards)}] ids {first}-{last} failed: "
+                        f"{result['error']}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"[{done}/{len(shards)}] ids {first}-{last}: "
+                        f"{result['migrated']} migrated, "
+                        f"{self.metrics.progress()}"))
+
+        self.stdout.write(
+            f"Migrated {totals['migrated']} properties, skipped "
+            f"{totals['skipped']}, images: {totals['images_copied']} copied, "
+            f"{totals['images_failed']} failed")
+        if failed:
+            self.stdout.write(self.style.ERROR(
+                f"{len(failed)} of {len(shards)} shards failed"))
+        self.metrics.finish()
+
+    def prepare_locations(self, scrapy_source):
+        # Create every location up front so workers only read them; the
+        # resolver still serializes any late inserts under a lock
+        candidates = scrapy_source.location_candidates()
+
+        resolver = LocationResolver()
+        resolver.load()
+        with transaction.atomic():
+            created = resolver.resolve(candidates)
+        self.stdout.write(
+            f"Prepared {len(resolver.locations)} locations "
+            f"({len(created)} created)")
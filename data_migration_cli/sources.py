@@ -0,0 +1,272 @@
+from contextlib import closing
+from itertools import islice
+import logging
+import os
+import sqlite3
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from config import SCRAPY_DATABASE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# First coordinates seen for every country and city name; rows without
+# coordinates are skipped, as in the copy engine
+LOCATION_CANDIDATES_SQL = """
+    SELECT country_name, 'country', latitude, longitude FROM properties
+    WHERE id IN (SELECT min(id) FROM properties WHERE country_name <> ''
+                   AND latitude IS NOT NULL AND longitude IS NOT NULL
+                 GROUP BY country_name)
+    UNION ALL
+    SELECT city_name, 'city', latitude, longitude FROM properties
+    WHERE id IN (SELECT min(id) FROM properties WHERE city_name <> ''
+                   AND latitude IS NOT NULL AND longitude IS NOT NULL
+                 GROUP BY city_name)
+"""
+
+# Connections per process kept to the Scrapy database
+POOL_SIZE = 4
+# Connections idle for longer than this are pinged before they are reused
+HEALTH_CHECK_INTERVAL = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    last_used = 0.0
+
+
+def get_pool(config=SCRAPY_DATABASE_CONFIG):
+    """The process-wide connection pool for ``config``, created on first
+    use and shared by every source that reads from that database."""
+    key = (os.getpid(), config['HOST'], config['PORT'], config['NAME'],
+           config['USER'])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            pool = _pools[key] = psycopg2.pool.ThreadedConnectionPool(
+                1, POOL_SIZE,
+                dbname=config['NAME'],
+                user=config['USER'],
+                password=config['PASSWORD'],
+                host=config['HOST'],
+                port=config['PORT'],
+                connection_factory=PooledConnection,
+                # Notice a dead server during long fetches instead of
+                # waiting on the socket forever
+                keepalives=1,
+                keepalives_idle=30,
+                keepalives_interval=10,
+                keepalives_count=3,
+            )
+        return pool
+
+
+def close_pools():
+    """Close every pool of this process. Must run before forking, a child
+    closing an inherited connection would close it for the parent too."""
+    with _pools_lock:
+        for pool in _pools.values():
+            if not pool.closed:
+                pool.closeall()
+        _pools.clear()
+
+
+class ScrapySource:
+    """Read access to a Scrapy ``properties`` table.
+
+    Rows are plain tuples in the table's column order: id, h3_tag,
+    country_name, city_name, title, star, rating, location, latitude,
+    longitude, room_type, price, image_paths.
+
+    Reads that fail with one of ``retryable_errors`` are retried on a new
+    connection, up to ``retries`` times with a growing delay. A batch read
+    resumes after the last row it yielded.
+    """
+    placeholder = '%s'
+    retryable_errors = ()
+
+    def __init__(self, fetch_size=1000, retries=3, retry_delay=1.0):
+        self.fetch_size = fetch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def acquire(self):
+        raise NotImplementedError
+
+    def release(self, conn, broken=False):
+        pass
+
+    def batch_cursor(self, conn):
+        return conn.cursor()
+
+    def acquire_with_retry(self):
+        attempt = 0
+        while True:
+            try:
+                return self.acquire()
+            except self.retryable_errors as e:
+                attempt += 1
+                self.retry(attempt, e)
+
+    def retry(self, attempt, error):
+        if attempt > self.retries:
+            raise error
+        delay = self.retry_delay * 2 ** (attempt - 1)
+        logger.warning("Scrapy database read failed (%s), retrying in "
+                       "%.1fs (%d/%d)", error, delay, attempt, self.retries)
+        time.sleep(delay)
+
+    def fetch_batches(self, batch_size, after_id=0, last_id=None):
+        """Rows with ``after_id < id <= last_id`` in id order, in lists of
+        ``batch_size``."""
+        attempt = 0
+        while True:
+            conn = self.acquire_with_retry()
+            try:
+                with closing(self.read_batches(
+                        conn, batch_size, after_id, last_id)) as batches:
+                    for rows in batches:
+                        yield rows
+                        after_id = rows[-1][0]
+                        attempt = 0
+            except self.retryable_errors as e:
+                self.release(conn, broken=True)
+                attempt += 1
+                self.retry(attempt, e)
+            except BaseException:
+                self.release(conn)
+                raise
+            else:
+                self.release(conn)
+                return
+
+    def id_range(self, after_id, last_id):
+        p = self.placeholder
+        where = f"id > {p}"
+        params = [after_id]
+        if last_id is not None:
+            where += f" AND id <= {p}"
+            params.append(last_id)
+        return where, params
+
+    def read_batches(self, conn, batch_size, after_id, last_id):
+        where, params = self.id_range(after_id, last_id)
+        cursor = self.batch_cursor(conn)
+        try:
+            cursor.execute(
+                f"SELECT * FROM properties WHERE {where} ORDER BY id", params)
+            # Iterating fetches ``fetch_size`` rows per round trip on a
+            # server-side cursor, whatever the batch size
+            rows = iter(cursor)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                yield batch
+        finally:
+            cursor.close()
+
+    def fetch_all(self, query, params=()):
+        attempt = 0
+        while True:
+            conn = self.acquire_with_retry()
+            try:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, params)
+                    rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+            except self.retryable_errors as e:
+                self.release(conn, broken=True)
+                attempt += 1
+                self.retry(attempt, e)
+            except BaseException:
+                self.release(conn)
+                raise
+            else:
+                self.release(conn)
+                return rows
+
+    def id_bounds(self):
+        return self.fetch_all("SELECT min(id), max(id) FROM properties")[0]
+
+    def count(self, after_id=0, last_id=None):
+        where, params = self.id_range(after_id, last_id)
+        return self.fetch_all(
+            f"SELECT count(*) FROM properties WHERE {where}", params)[0][0]
+
+    def location_candidates(self):
+        return self.fetch_all(LOCATION_CANDIDATES_SQL)
+
+    def close(self):
+        pass
+
+
+class PostgresSource(ScrapySource):
+    """The Scrapy database configured in config.py, read through the
+    shared connection pool."""
+    retryable_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+    def __init__(self, config=SCRAPY_DATABASE_CONFIG, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = get_pool(config)
+
+    def acquire(self):
+        conn = self.pool.getconn()
+        if not conn.closed and (time.monotonic() - conn.last_used
+                                < HEALTH_CHECK_INTERVAL):
+            return conn
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except self.retryable_errors:
+            # Dropped while idle, replace it with a fresh one
+            self.pool.putconn(conn, close=True)
+            conn = self.pool.getconn()
+        return conn
+
+    def release(self, conn, broken=False):
+        conn.last_used = time.monotonic()
+        self.pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def copy_to(self, query, file):
+        """Write the rows of ``query`` to ``file`` in COPY text format."""
+        conn = self.acquire_with_retry()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT", file)
+        except self.retryable_errors:
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def batch_cursor(self, conn):
+        # A named cursor is server-side, so rows are streamed from the
+        # Scrapy database in chunks instead of being fetched all at once
+        cursor = conn.cursor(name='scrapy_properties')
+        cursor.itersize = self.fetch_size
+        return cursor
+
+
+class SqliteSource(ScrapySource):
+    """A ``properties`` table in an SQLite file, such as the stand-in the
+    benchmark command generates."""
+    placeholder = '?'
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.conn = sqlite3.connect(path)
+
+    def acquire(self):
+        return self.conn
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,104 @@
+import os
+import random
+import sqlite3
+from PIL import Image
+from admin_panel import read_model
+from admin_panel.models import Amenity, Property
+
+SCRAPY_TABLE_SQL = """
+    CREATE TABLE properties (
+        id INTEGER PRIMARY KEY,
+        h3_tag TEXT,
+        country_name TEXT,
+        city_name TEXT,
+        title TEXT,
+        star INTEGER,
+        rating REAL,
+        location TEXT,
+        latitude REAL,
+        longitude REAL,
+        room_type TEXT,
+        price REAL,
+        image_paths TEXT
+    )
+"""
+TITLE_WORDS = ('Grand', 'Royal', 'Ocean', 'Garden', 'City', 'Palace',
+               'Lake', 'Hill', 'Central', 'Sunset', 'Harbour', 'Park')
+PROPERTY_KINDS = ('Hotel', 'Resort', 'Inn', 'Suites', 'Lodge', 'Residence')
+ROOM_TYPES = ('single', 'double', 'twin', 'suite', 'family')
+IMAGE_SIZE = (640, 480)
+
+
+def generate_catalogue(directory, properties, locations,
+                       images_per_property, seed=0):
+    """Write a Scrapy ``properties`` table to an SQLite file and its image
+    files to a crawl directory under ``directory``.
+
+    About one location in ten is a country, the rest are cities. Returns
+    the SQLite path and the crawl base path.
+    """
+    rng = random.Random(seed)
+    countries = [f'Country {i}' for i in range(max(1, locations // 10))]
+    cities = [
+        (f'City {i}', rng.choice(countries),
+         rng.uniform(-60, 70), rng.uniform(-180, 180))
+        for i in range(max(1, locations - len(countries)))
+    ]
+
+    crawl_path = os.path.join(directory, 'crawl')
+    os.makedirs(os.path.join(crawl_path, 'images'))
+    db_path = os.path.join(directory, 'scrapy.sqlite3')
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(SCRAPY_TABLE_SQL)
+        rows = []
+        for source_id in range(1, properties + 1):
+            city, country, latitude, longitude = rng.choice(cities)
+            image_paths = []
+            for n in range(images_per_property):
+                image_path = f'images/{source_id}_{n}.jpg'
+                write_image(os.path.join(crawl_path, image_path), rng)
+                image_paths.append(image_path)
+            rows.append((
+                source_id, f'h3-{source_id:x}', country, city,
+                f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} '
+                f'{rng.choice(PROPERTY_KINDS)} {source_id}',
+                rng.randint(1, 5), round(rng.uniform(5, 10), 1),
+                f'{city}, {country}',
+                latitude + rng.uniform(-0.1, 0.1),
+                longitude + rng.uniform(-0.1, 0.1),
+                rng.choice(ROOM_TYPES), round(rng.uniform(20, 500), 2),
+                ','.join(image_paths),
+            ))
+        conn.executemany(
+            f"INSERT INTO properties VALUES ({', '.join(['?'] * 13)})", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path, crawl_path
+
+
+def write_image(path, rng):
+    # Noise over a solid colour compresses about like a photo does
+    colour = tuple(rng.randrange(256) for _ in range(3))
+    noise = Image.effect_noise(IMAGE_SIZE, 48).convert('RGB')
+    image = Image.blend(Image.new('RGB', IMAGE_SIZE, colour), noise, 0.3)
+    image.save(path, 'JPEG', quality=85)
+
+
+def attach_amenities(amenities, per_property, seed=0):
+    """Create ``amenities`` Amenity rows and link ``per_property`` of them
+    to every Property. The Scrapy table has no amenities."""
+    rng = random.Random(seed)
+    created = Amenity.objects.bulk_create(
+        [Amenity(name=f'Amenity {i}') for i in range(amenities)])
+    per_property = min(per_property, len(created))
+    through = Property.amenities.through
+    links = [
+        through(property_id=property_id, amenity_id=amenity.id)
+        for property_id in Property.objects.values_list('id', flat=True)
+        for amenity in rng.sample(created, per_property)
+    ]
+    through.objects.bulk_create(links, batch_size=5000)
+    read_model.rebuild()
+    return len(links)
@@ -0,0 +1,91 @@
+import io
+import os
+import sqlite3
+import tempfile
+from django.core.management.color import no_style
+from django.test import TestCase, override_settings
+from admin_panel.models import Property, PropertyImage
+from data_migration_cli.management.commands.migrate_scrapy_data import (
+    DataMigrator)
+from data_migration_cli.models import MigrationCheckpoint, MissingImage
+from data_migration_cli.sources import SqliteSource
+from data_migration_cli.synthetic import generate_catalogue
+
+
+class IncrementalMigrationTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=os.path.join(directory.name, 'media'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.db_path, self.crawl_path = generate_catalogue(
+            directory.name, properties=6, locations=3, images_per_property=2)
+
+    def migrate(self, source=None):
+        stdout = io.StringIO()
+        migrator = DataMigrator(
+            stdout, no_style(), dry_run=False, batch_size=2,
+            incremental=True, image_workers=2,
+            scrapy_source=source or SqliteSource(self.db_path),
+            image_base_path=self.crawl_path)
+        # Counters are updated when a batch commits
+        with self.captureOnCommitCallbacks(execute=True):
+            migrator.migrate()
+        return migrator, stdout.getvalue()
+
+    def test_unchanged_rows_are_skipped(self):
+        migrator, _ = self.migrate()
+        self.assertEqual(migrator.migrated, 6)
+        self.assertEqual(PropertyImage.objects.count(), 12)
+
+        migrator, _ = self.migrate()
+        self.assertEqual((migrator.migrated, migrator.skipped), (0, 6))
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE properties SET title = 'Renamed' WHERE id = 3")
+        conn.commit()
+        conn.close()
+        migrator, _ = self.migrate()
+        self.assertEqual((migrator.migrated, migrator.skipped), (1, 5))
+        obj = Property.objects.get(property_id='3')
+        self.assertEqual(obj.title, 'Renamed')
+        self.assertIsNotNone(obj.update_date)
+        self.assertEqual(PropertyImage.objects.count(), 12)
+
+    def test_interrupted_run_resumes_after_the_last_batch(self):
+        source = SqliteSource(self.db_path)
+        fetch_batches = source.fetch_batches
+
+        def interrupted(*args):
+            batches = fetch_batches(*args)
+            yield next(batches)
+            raise ConnectionError('connection lost')
+
+        source.fetch_batches = interrupted
+        migrator, _ = self.migrate(source)
+        self.assertEqual(migrator.error, 'connection lost')
+        checkpoint = MigrationCheckpoint.objects.get(source='properties')
+        self.assertEqual(checkpoint.last_source_id, 2)
+        self.assertFalse(checkpoint.completed)
+        # The committed batch has its images
+        self.assertEqual(PropertyImage.objects.count(), 4)
+
+        migrator, output = self.migrate()
+        self.assertIn('Resuming after source id 2', output)
+        self.assertEqual(migrator.migrated, 4)
+        self.assertEqual(PropertyImage.objects.count(), 12)
+        checkpoint.refresh_from_db()
+        self.assertTrue(checkpoint.completed)
+
+    def test_missing_files_do_not_import_the_row_again(self):
+        os.remove(os.path.join(self.crawl_path, 'images', '4_1.jpg'))
+        self.migrate()
+        self.assertEqual(PropertyImage.objects.count(), 11)
+        self.assertEqual(
+            list(MissingImage.objects.values_list('caption', flat=True)),
+            ['4_1.jpg'])
+
+        migrator, _ = self.migrate()
+        self.assertEqual((migrator.migrated, migrator.skipped), (0, 6))
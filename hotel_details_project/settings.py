@@ -19,6 +19,19 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_ROOT = BASE_DIR
 MEDIA_URL = '/media/'
+# Let the front end server send media files: 'X-Sendfile' (Apache,
+# lighttpd) or 'X-Accel-Redirect' (nginx). None streams them from Django.
+MEDIA_SENDFILE_HEADER = None
+# nginx internal location aliased to MEDIA_ROOT, for X-Accel-Redirect
+MEDIA_SENDFILE_URL = '/protected-media/'
+
+# Chunked image uploads from the property change form. Partial files are
+# kept here, outside the public media folders, until the upload finishes.
+IMAGE_UPLOAD_DIR = BASE_DIR / 'uploads'
+IMAGE_UPLOAD_CHUNK_SIZE = 1024 * 1024
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+# Seconds an unfinished upload can be resumed for
+IMAGE_UPLOAD_EXPIRY = 24 * 60 * 60
 
 
 # Quick-start development settings - unsuitable for production
@@ -49,6 +62,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'admin_panel.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +72,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request query and timing instrumentation, off unless enabled here.
+# Summarize the log with: python manage.py instrumentation_report
+INSTRUMENTATION_ENABLED = False
+INSTRUMENTATION_SLOW_REQUEST_MS = 500
+INSTRUMENTATION_SLOW_QUERY_MS = 100
+# Flag a query signature run this many times in one request (N+1)
+INSTRUMENTATION_DUPLICATE_THRESHOLD = 5
+INSTRUMENTATION_LOG = BASE_DIR / 'instrumentation.jsonl'
+
 ROOT_URLCONF = 'hotel_details_project.urls'
 
 TEMPLATES = [
@@ -83,7 +106,36 @@ WSGI_APPLICATION = 'hotel_details_project.wsgi.application'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 DATABASES = {
-    'default': DJANGO_DATABASE_CONFIG
+    'default': {
+        # Keep connections open between requests and batches, checked
+        # before reuse; config.py can override both
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        **DJANGO_DATABASE_CONFIG,
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-property summaries shown in the admin. In the database, so the
+    # migrate_scrapy_data command invalidates what the web server reads,
+    # and culled with a DELETE rather than a scan of every entry.
+    'property_summaries': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'property_summary_cache',
+        'TIMEOUT': 7 * 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            # Evict a third of the entries once MAX_ENTRIES is reached
+            'CULL_FREQUENCY': 3,
+        },
+    },
 }
 
 
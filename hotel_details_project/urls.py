@@ -16,15 +16,21 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from django.conf.urls.static import static
 from django.conf import settings
-from admin_panel import views
+from admin_panel import api, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.welcome, name='welcome'),
+    path('api/properties/', api.property_list, name='api-property-list'),
+    path('api/properties/summaries/', api.property_summaries,
+         name='api-property-summaries'),
+    path('api/properties/near/', api.properties_near,
+         name='api-properties-near'),
+    path('api/properties/search/', api.property_search,
+         name='api-property-search'),
+    path('api/properties/<int:pk>/', api.property_detail,
+         name='api-property-detail'),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", views.serve_media,
+         name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,20 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Reload the changelist with the chosen value, the same way the
+    // regular filter links do
+    $(function() {
+        $('.autocomplete-filter-select').on('change', function() {
+            const params = new URLSearchParams(window.location.search);
+            const parameter = this.dataset.parameter;
+            if (this.value) {
+                params.set(parameter, this.value);
+            } else {
+                params.delete(parameter);
+            }
+            params.delete('p');
+            window.location.search = params.toString();
+        });
+    });
+}
@@ -1,6 +1,6 @@
 document.addEventListener('DOMContentLoaded', function () {
     function setupImagePreviews() {
-        document.querySelectorAll('input[type="file"]').forEach(function (input) {
+        document.querySelectorAll('input[type="file"]:not(.image-upload-input)').forEach(function (input) {
             input.addEventListener('change', function () {
                 var reader = new FileReader();
                 reader.onload = function (e) {
@@ -17,8 +17,216 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
 
+    // Chunked, resumable upload of many images at once, see
+    // admin_panel/uploads.py for the endpoints
+    function setupBulkUpload() {
+        var module = document.querySelector('.image-upload');
+        if (!module) {
+            return;
+        }
+        var input = module.querySelector('.image-upload-input');
+        var list = module.querySelector('.image-upload-list');
+        var status = module.querySelector('.image-upload-status');
+        var startUrl = module.dataset.uploadUrl;
+        var chunkSize = parseInt(module.dataset.chunkSize, 10);
+        var csrfToken = document.querySelector('[name="csrfmiddlewaretoken"]').value;
+        var parallelFiles = 3;
+        var maxRetries = 5;
+
+        function send(method, url, body, headers) {
+            return fetch(url, {
+                method: method,
+                body: body,
+                credentials: 'same-origin',
+                headers: Object.assign({'X-CSRFToken': csrfToken}, headers || {})
+            }).then(function (response) {
+                return response.json().catch(function () {
+                    return {};
+                }).then(function (data) {
+                    data.status = response.status;
+                    return data;
+                });
+            });
+        }
+
+        function sendJson(url, data) {
+            return send('POST', url, JSON.stringify(data),
+                        {'Content-Type': 'application/json'});
+        }
+
+        function wait(ms) {
+            return new Promise(function (resolve) {
+                setTimeout(resolve, ms);
+            });
+        }
+
+        function addRow(file) {
+            var row = document.createElement('li');
+            var preview = document.createElement('img');
+            preview.className = 'image-preview';
+            preview.src = URL.createObjectURL(file);
+            var name = document.createElement('span');
+            name.textContent = file.name;
+            var progress = document.createElement('progress');
+            progress.max = file.size;
+            progress.value = 0;
+            var state = document.createElement('span');
+            state.className = 'image-upload-state';
+            row.append(preview, name, progress, state);
+            list.appendChild(row);
+            return {progress: progress, state: state};
+        }
+
+        // The upload id is kept per file, so choosing the same file again
+        // after a dropped connection or a reload resumes it
+        function storageKey(file) {
+            return ['image-upload', startUrl, file.name, file.size,
+                    file.lastModified].join(':');
+        }
+
+        function resumeOrStart(file) {
+            var id = localStorage.getItem(storageKey(file));
+            var resumed = id ? send('GET', startUrl + id + '/') : Promise.resolve({status: 404});
+            return resumed.then(function (data) {
+                if (data.status === 200) {
+                    return data;
+                }
+                return sendJson(startUrl, {name: file.name, size: file.size}).then(function (data) {
+                    if (data.status !== 201) {
+                        throw new Error(data.error || 'Could not start the upload');
+                    }
+                    localStorage.setItem(storageKey(file), data.id);
+                    return data;
+                });
+            });
+        }
+
+        function sendChunks(file, upload, ui) {
+            var url = startUrl + upload.id + '/';
+            var offset = upload.offset;
+            var retries = 0;
+
+            function next() {
+                ui.progress.value = offset;
+                ui.state.textContent = Math.floor(100 * offset / file.size) + '%';
+                if (offset >= file.size) {
+                    return Promise.resolve(upload.id);
+                }
+                var chunk = file.slice(offset, offset + chunkSize);
+                return send('PUT', url, chunk, {
+                    'Content-Type': 'application/octet-stream',
+                    'Upload-Offset': String(offset)
+                }).then(function (data) {
+                    if (data.status === 200 || data.status === 409) {
+                        // 409: the server has a different offset, go on from there
+                        offset = data.offset;
+                        retries = 0;
+                        return next();
+                    }
+                    throw new Error(data.error || 'Upload failed');
+                }, function () {
+                    // Network error: wait, ask how much arrived and retry
+                    if (retries >= maxRetries) {
+                        throw new Error('Connection lost');
+                    }
+                    retries += 1;
+                    ui.state.textContent = 'Retrying...';
+                    return wait(1000 * Math.pow(2, retries)).then(function () {
+                        return send('GET', url);
+                    }).then(function (data) {
+                        if (data.status === 200) {
+                            offset = data.offset;
+                        }
+                        return next();
+                    }, next);
+                });
+            }
+            return next();
+        }
+
+        function uploadFile(file) {
+            var ui = addRow(file);
+            return resumeOrStart(file).then(function (upload) {
+                return sendChunks(file, upload, ui);
+            }).then(function (id) {
+                ui.state.textContent = 'Uploaded';
+                return {file: file, id: id, ui: ui};
+            }, function (error) {
+                ui.state.textContent = error.message;
+                return null;
+            });
+        }
+
+        // At most ``size`` files in flight, chunks of a file go one by one
+        function runPool(items, worker, size) {
+            var index = 0;
+            var results = [];
+            function next() {
+                if (index >= items.length) {
+                    return Promise.resolve();
+                }
+                var position = index++;
+                return worker(items[position]).then(function (result) {
+                    results[position] = result;
+                    return next();
+                });
+            }
+            var runners = [];
+            for (var i = 0; i < Math.min(size, items.length); i++) {
+                runners.push(next());
+            }
+            return Promise.all(runners).then(function () {
+                return results;
+            });
+        }
+
+        input.addEventListener('change', function () {
+            var files = Array.prototype.slice.call(input.files);
+            if (!files.length) {
+                return;
+            }
+            input.disabled = true;
+            status.textContent = 'Uploading ' + files.length + ' images...';
+            runPool(files, uploadFile, parallelFiles).then(function (results) {
+                var uploaded = results.filter(Boolean);
+                if (!uploaded.length) {
+                    return {images: [], errors: {}};
+                }
+                status.textContent = 'Adding the images...';
+                return sendJson(startUrl + 'complete/', {
+                    ids: uploaded.map(function (result) {
+                        return result.id;
+                    })
+                }).then(function (data) {
+                    uploaded.forEach(function (result) {
+                        var error = (data.errors || {})[result.id];
+                        result.ui.state.textContent = error || 'Added';
+                        if (!error) {
+                            localStorage.removeItem(storageKey(result.file));
+                        }
+                    });
+                    return data;
+                });
+            }).then(function (data) {
+                var added = (data.images || []).length;
+                if (added < files.length) {
+                    status.textContent = added + ' of ' + files.length +
+                        ' images added. Choose the others again to resume them.';
+                } else {
+                    status.textContent = added + ' images added. Reload the page to edit them.';
+                }
+            }, function (error) {
+                status.textContent = 'Upload failed: ' + error.message;
+            }).then(function () {
+                input.disabled = false;
+                input.value = '';
+            });
+        });
+    }
+
     // Initial setup
     setupImagePreviews();
+    setupBulkUpload();
 
     // Setup for dynamically added rows
     if (typeof django !== 'undefined' && django.jQuery) {
@@ -26,4 +234,4 @@ document.addEventListener('DOMContentLoaded', function () {
             setupImagePreviews();
         });
     }
-});
\ No newline at end of file
+});